@@ -0,0 +1,81 @@
+""" Контрольные точки долгих расчётов: сохранение состояния цикла по времени
+    и продолжение расчёта с того же места (см. utils.resume_runner).
+
+    Состояние пишется в один несжатый файл .npz. Запись атомарная: файл
+    сначала целиком пишется во временный файл рядом с целевым, затем
+    переименовывается, так что при падении посреди записи на диске
+    остаётся предыдущая целая контрольная точка.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+def save_checkpoint(path, U, t, iter_num, time_steps, params, window=None, dt_next=None):
+    """ Атомарная запись контрольной точки.
+
+        Вход:
+            path: str
+                Путь к файлу контрольной точки (.npz)
+            U: np.array
+                Текущее решение
+            t: float
+                Текущее время
+            iter_num: int
+                Число выполненных итераций (включая отвергнутые шаги)
+            time_steps: utils.TimeStepsHistory
+                История принятых шагов со счётчиками
+            params: dict
+                Параметры расчёта (названия методов, Cu, total_time и т.д.),
+                сохраняются в JSON
+            window: tuple(int, int)
+                Текущее активное окно, если оно используется
+            dt_next: float
+                Предлагаемый следующий шаг адаптивного метода
+    """
+    state = dict(
+        U=U,
+        t=np.float64(t),
+        iter_num=np.int64(iter_num),
+        time_steps=np.asarray(time_steps, dtype=np.float64),
+        counters=np.array([time_steps.n_rejected, time_steps.n_rhs_calls], dtype=np.int64),
+        params=np.array(json.dumps(params)),
+    )
+    if window is not None:
+        state['window'] = np.array(window, dtype=np.int64)
+    if dt_next is not None:
+        state['dt_next'] = np.float64(dt_next)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **state)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """ Чтение контрольной точки.
+
+        Выход:
+            state: dict
+                'U', 't', 'iter_num', 'time_steps', 'n_rejected', 'n_rhs_calls',
+                'params', а также 'window' и 'dt_next', если они были сохранены
+    """
+    with np.load(path) as data:
+        state = dict(
+            U=data['U'],
+            t=float(data['t']),
+            iter_num=int(data['iter_num']),
+            time_steps=data['time_steps'].tolist(),
+            n_rejected=int(data['counters'][0]),
+            n_rhs_calls=int(data['counters'][1]),
+            params=json.loads(str(data['params'])),
+        )
+        if 'window' in data:
+            state['window'] = tuple(int(ind) for ind in data['window'])
+        if 'dt_next' in data:
+            state['dt_next'] = float(data['dt_next'])
+    return state
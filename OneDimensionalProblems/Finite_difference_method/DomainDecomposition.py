@@ -0,0 +1,211 @@
+""" Решение на очень больших сетках несколькими процессами.
+
+    Узлы сетки делятся на непрерывные подобласти, каждую подобласть
+    продвигает по времени свой процесс. Решение, промежуточные слои
+    и слои k лежат в общей памяти (multiprocessing.shared_memory),
+    поэтому обмен граничными (фиктивными) узлами - это чтение соседних
+    участков общего массива после барьера, один раз на стадию метода.
+
+    Каждый процесс вычисляет правую часть на своей подобласти,
+    расширенной на ghost_width узлов в обе стороны, а линейные комбинации
+    стадий - тем же RungeCuttaStepper.combine, что и последовательный расчёт,
+    поэтому результат совпадает с utils.main_runner до бита.
+"""
+
+import utils
+import RungeCuttaMethods
+import SpaceDerivApproxMethods
+
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def get_subdomains(N, n_workers):
+    """ Разбиение узлов 0 .. N-1 на n_workers непрерывных участков
+        почти одинаковой длины.
+
+        Выход:
+            subdomains: list[tuple(int, int)]
+                Участки [start_ind, finish_ind)
+    """
+    bounds = np.linspace(0, N, n_workers + 1).round().astype(int)
+    return [(int(bounds[i]), int(bounds[i + 1])) for i in range(n_workers)]
+
+
+def get_ghost_width(space_deriv_approx_method):
+    """ Число фиктивных узлов с каждой стороны подобласти: ширина шаблона """
+    min_ind, max_ind = SpaceDerivApproxMethods.get_stencil_indexes(space_deriv_approx_method)
+    return max(-min_ind, max_ind)
+
+
+def get_time_steps(mesh, Cu, total_time, N_iter_max):
+    """ Шаги по времени, как в utils.run_time_loop с постоянным шагом.
+        Все процессы используют один и тот же заранее вычисленный список.
+
+        Выход:
+            times: list[float]
+                Время в начале каждого шага
+            time_steps: utils.TimeStepsHistory
+                Шаги по времени
+    """
+    _t = 0
+    times = []
+    time_steps = utils.TimeStepsHistory()
+    for inter_num in range(N_iter_max):
+        if _t >= total_time:
+            break
+        dt = utils.get_dt(_t, total_time, mesh, Cu, None)
+        times.append(_t)
+        time_steps.append(dt)
+        _t += dt
+    return times, time_steps
+
+
+def _attach(shm, shape):
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _advance_subdomain(task_params, mesh, time_step_method, space_deriv_approx_method, boundary, upwind,
+                       times, time_steps, subdomain, ghost_width, U_bufs, U_star_bufs, k, barrier):
+    """ Продвижение одной подобласти на все шаги по времени.
+
+        Вход:
+            subdomain: tuple(int, int)
+                Собственные узлы процесса [start_ind, finish_ind)
+            U_bufs: np.array
+                Общий массив (2, ..., N): решение на текущем и новом слоях
+            U_star_bufs: np.array
+                Общий массив (2, ..., N): промежуточные слои соседних стадий
+            k: np.array
+                Общий массив (s, ..., N) слоёв метода
+            barrier: Barrier
+                Барьер всех процессов
+            остальные аргументы - как в decomposed_runner
+    """
+    N = mesh.N
+    start_ind, finish_ind = subdomain
+    own = (Ellipsis, slice(start_ind, finish_ind))
+    window_start = max(0, start_ind - ghost_width)
+    window_finish = min(N, finish_ind + ghost_width)
+    window = (Ellipsis, slice(window_start, window_finish))
+    own_in_window = (Ellipsis, slice(start_ind - window_start, finish_ind - window_start))
+    submesh = mesh.get_submesh(window_start, window_finish)
+
+    right_function = utils.generate_right_function_for_dUdt_problem(task_params, space_deriv_approx_method,
+                                                                    mesh, boundary, upwind=upwind)
+    butcher_table = RungeCuttaMethods.butcher_tables_base[time_step_method]
+    # слои k и промежуточные слои собственной подобласти - участки общих массивов,
+    # свои буферы stepper выделяет только для сумм стадий
+    stepper = RungeCuttaMethods.RungeCuttaStepper(butcher_table, U_bufs[0][own].shape,
+                                                  k=k[own], U_star=U_star_bufs[0][own])
+
+    curr = 0
+    star = 0
+    for t_curr, dt in zip(times, time_steps):
+        U_curr = U_bufs[curr]
+        stepper.k[0] = right_function(submesh, t_curr, U_curr[window])[own_in_window]
+        for i in range(1, stepper.s):
+            U_star = U_star_bufs[star]
+            stepper.combine(U_curr[own], dt, stepper.a[i], stepper.a_nonzero[i], U_star[own])
+            # после барьера фиктивные узлы соседей уже вычислены
+            barrier.wait()
+            t_star = t_curr + stepper.c[i] * dt
+            stepper.k[i] = right_function(submesh, t_star, U_star[window])[own_in_window]
+            # следующая стадия пишет в другой буфер, пока соседи читают этот
+            star = 1 - star
+        stepper.combine(U_curr[own], dt, stepper.b, stepper.b_nonzero, U_bufs[1 - curr][own])
+        barrier.wait()
+        curr = 1 - curr
+    return curr
+
+
+def _worker(shm_names, shapes, barrier, args):
+    """ Процесс-работник: подключение к общей памяти и расчёт своей подобласти """
+    shms = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    try:
+        arrays = [_attach(shm, shape) for shm, shape in zip(shms, shapes)]
+        _advance_subdomain(*args, *arrays, barrier)
+    except BaseException:
+        # остальные процессы не должны вечно ждать на барьере
+        barrier.abort()
+        raise
+    finally:
+        del arrays
+        for shm in shms:
+            shm.close()
+
+
+def decomposed_runner(task_params, mesh, Cu, total_time, time_step_method, space_deriv_approx_method,
+                      N_iter_max, n_workers=None, boundary="zero", upwind=False):
+    """ Численное решение уравнения переноса несколькими процессами
+        с разбиением сетки на подобласти.
+
+        Результат совпадает с utils.main_runner с теми же параметрами.
+        Поддерживаются явные методы с постоянным шагом на равномерной сетке
+        с непериодической границей. speed_function, right_function и stiff_coef
+        вызываются на части сетки (mesh.get_submesh), поэтому должны вычисляться
+        поточечно, как и для активного окна.
+
+        Вход:
+            n_workers: int
+                Число процессов; по умолчанию - число ядер.
+                При n_workers = 1 расчёт идёт в текущем процессе
+            остальные аргументы - как в main_runner
+
+        Выход:
+            как в main_runner
+    """
+    if RungeCuttaMethods.is_implicit(time_step_method) or boundary == "periodic" or not mesh.uniform:
+        raise ValueError("Разбиение на подобласти возможно только для явных методов, непериодической"
+                         " границы и равномерной сетки")
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    ghost_width = get_ghost_width(space_deriv_approx_method)
+    subdomains = get_subdomains(mesh.N, n_workers)
+    # односторонние замыкания у границ берут width = 2 * ghost_width + 1 узлов
+    if min(finish_ind - start_ind for start_ind, finish_ind in subdomains) < 2 * ghost_width + 1:
+        raise ValueError("Подобласти слишком малы для шаблона, уменьшите число процессов")
+
+    times, time_steps = get_time_steps(mesh, Cu, total_time, N_iter_max)
+    U0 = utils.get_init_field(mesh, task_params.init_cond)
+    n_stages = RungeCuttaMethods.butcher_tables_base[time_step_method]['c'].shape[0]
+    shapes = [(2,) + U0.shape, (2,) + U0.shape, (n_stages,) + U0.shape]
+    shms = [shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8) for shape in shapes]
+    try:
+        U_bufs, U_star_bufs, k = [_attach(shm, shape) for shm, shape in zip(shms, shapes)]
+        U_bufs[0] = U0
+        common_args = (task_params, mesh, time_step_method, space_deriv_approx_method, boundary, upwind,
+                       times, time_steps)
+
+        if n_workers == 1:
+            curr = _advance_subdomain(*common_args, subdomains[0], ghost_width,
+                                      U_bufs, U_star_bufs, k, threading.Barrier(1))
+        else:
+            context = utils.get_mp_context()
+            barrier = context.Barrier(n_workers)
+            names = [shm.name for shm in shms]
+            processes = [context.Process(target=_worker,
+                                         args=(names, shapes, barrier,
+                                               common_args + (subdomain, ghost_width)))
+                         for subdomain in subdomains]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            if any(process.exitcode != 0 for process in processes):
+                raise RuntimeError("Один из процессов расчёта завершился с ошибкой")
+            curr = len(time_steps) % 2
+
+        U = U_bufs[curr].copy()
+        del U_bufs, U_star_bufs, k
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    time_steps.n_accepted = len(time_steps)
+    time_steps.n_rhs_calls = n_stages * len(time_steps)
+    return U, time_steps
@@ -0,0 +1,266 @@
+""" Необязательный компилируемый (numba) вариант явного метода Рунге-Кутты.
+
+    Каждая стадия выполняется двумя циклами по узлам:
+        - вычисление промежуточного решения U* = U + dt * sum(a_ij * k_j);
+        - правая часть k_i = f - sigma * U* - speed * dU*/dx, где шаблон
+          производной, умножение на скорость и источник объединены в один проход.
+    Циклы распараллелены по узлам (prange). Функции speed_function,
+    right_function и stiff_coef остаются обычными функциями Python
+    и вызываются один раз на стадию.
+
+    Если numba не установлена, NUMBA_AVAILABLE = False, и utils.main_runner
+    использует обычный путь на numpy.
+"""
+
+import RungeCuttaMethods
+
+import time
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+# коды граничных замыканий для ядра правой части
+_boundary_modes = {
+    "zero" : 0,
+    "one-sided" : 1,
+    "periodic" : 2,
+}
+
+
+# размер блока узлов, обрабатываемого одним потоком
+_BLOCK = 1024
+
+
+if NUMBA_AVAILABLE:
+
+    @numba.njit(parallel=True, cache=True)
+    def _combine_kernel(U, k, coefs, nonzero, dt, out):
+        """ out = U + dt * sum(coefs[j] * k[j]) для массивов формы (M, N) """
+        M, N = U.shape
+        n_nonzero = nonzero.shape[0]
+        n_blocks = (N + _BLOCK - 1) // _BLOCK
+        for m in range(M):
+            for block in numba.prange(n_blocks):
+                start = block * _BLOCK
+                finish = min(start + _BLOCK, N)
+                if n_nonzero == 0:
+                    for j in range(start, finish):
+                        out[m, j] = U[m, j]
+                    continue
+                # блок помещается в кэш первого уровня, поэтому внутренние
+                # циклы по узлам векторизуются, а данные читаются из памяти один раз
+                acc = np.empty(finish - start)
+                k_q = k[nonzero[0], m]
+                coef = coefs[nonzero[0]]
+                for j in range(start, finish):
+                    acc[j - start] = k_q[j] * coef
+                for q in range(1, n_nonzero):
+                    k_q = k[nonzero[q], m]
+                    coef = coefs[nonzero[q]]
+                    for j in range(start, finish):
+                        acc[j - start] += k_q[j] * coef
+                for j in range(start, finish):
+                    out[m, j] = U[m, j] + acc[j - start] * dt
+
+    @numba.njit(parallel=True, cache=True)
+    def _right_function_kernel(U, speed, src, sigma, use_sigma, offsets, weights,
+                               n_left, n_right, left_closure, right_closure, mode, out):
+        """ out = src - (speed * dU/dx + sigma * U) для массивов формы (M, N) """
+        M, N = U.shape
+        n_weights = offsets.shape[0]
+        if mode == 2:
+            # периодическая граница: последний узел совпадает с первым,
+            # у граничных узлов индексы шаблона берутся по модулю N - 1
+            start_ind, finish_ind = n_left, N - 1 - n_right
+        else:
+            start_ind, finish_ind = n_left, N - n_right
+        n_interior = max(finish_ind - start_ind, 0)
+        n_blocks = (n_interior + _BLOCK - 1) // _BLOCK
+        for m in range(M):
+            U_m = U[m]
+            # внутренние узлы: шаблон помещается целиком
+            for block in numba.prange(n_blocks):
+                start = start_ind + block * _BLOCK
+                finish = min(start + _BLOCK, finish_ind)
+                dUdx = np.empty(finish - start)
+                offset = offsets[0]
+                weight = weights[0]
+                for j in range(start, finish):
+                    dUdx[j - start] = U_m[j + offset] * weight
+                for q in range(1, n_weights):
+                    offset = offsets[q]
+                    weight = weights[q]
+                    for j in range(start, finish):
+                        dUdx[j - start] += U_m[j + offset] * weight
+                for j in range(start, finish):
+                    value = speed[m, j] * dUdx[j - start]
+                    if use_sigma:
+                        value += sigma[m, j] * U_m[j]
+                    out[m, j] = src[m, j] - value
+
+            # граничные узлы
+            for j in range(0, min(start_ind, N)):
+                _boundary_node(U_m, m, j, speed, src, sigma, use_sigma, offsets, weights,
+                               n_left, n_right, left_closure, right_closure, mode, out)
+            for j in range(max(finish_ind, start_ind), N):
+                _boundary_node(U_m, m, j, speed, src, sigma, use_sigma, offsets, weights,
+                               n_left, n_right, left_closure, right_closure, mode, out)
+
+    @numba.njit(cache=True)
+    def _boundary_node(U_m, m, j, speed, src, sigma, use_sigma, offsets, weights,
+                       n_left, n_right, left_closure, right_closure, mode, out):
+        """ Правая часть в узле, где шаблон не помещается целиком """
+        N = U_m.shape[0]
+        width = left_closure.shape[1]
+        if mode == 2:
+            P = N - 1
+            jj = j if j < P else 0
+            dUdx = U_m[(jj + offsets[0]) % P] * weights[0]
+            for q in range(1, offsets.shape[0]):
+                dUdx += U_m[(jj + offsets[q]) % P] * weights[q]
+        elif mode == 1 and j < n_left:
+            dUdx = 0.0
+            for q in range(width):
+                dUdx += U_m[q] * left_closure[j, q]
+        elif mode == 1:
+            dUdx = 0.0
+            jr = j - (N - n_right)
+            for q in range(width):
+                dUdx += U_m[N - width + q] * right_closure[jr, q]
+        else:
+            dUdx = 0.0
+        dUdx = speed[m, j] * dUdx
+        if use_sigma:
+            dUdx += sigma[m, j] * U_m[j]
+        out[m, j] = src[m, j] - dUdx
+
+
+def _as_2d(U):
+    """ Представление массива решения в виде (M, N) без копирования """
+    if U.ndim == 1:
+        return U[np.newaxis, :]
+    return U.reshape(-1, U.shape[-1])
+
+
+class FusedRungeCuttaStepper(RungeCuttaMethods.RungeCuttaStepper):
+    """ Явный метод Рунге-Кутты с компилируемыми ядрами numba.
+
+        Интерфейс тот же, что у RungeCuttaStepper, но правая часть
+        собирается из task_params и оператора производной, заданных
+        при создании; аргумент right_function метода step не используется.
+    """
+
+    def __init__(self, butcher_table, shape, task_params, dUdx_operator, dtype=np.float64):
+        """
+        Вход:
+            butcher_table: dict
+                Таблица Бутчера в формате runge_cutta_general_method
+            shape : int или tuple
+                Форма массива решения: N или (n_members, N)
+            task_params: TaskParams
+                Параметры уравнения переноса
+            dUdx_operator: SpaceDerivApproxMethods.StencilOperator
+                Оператор пространственной производной
+            dtype : np.dtype
+                Тип хранения слоёв и решения (см. RungeCuttaStepper);
+                суммы внутри ядер накапливаются в float64
+        """
+        if not NUMBA_AVAILABLE:
+            raise ImportError("Для компилируемых ядер нужен пакет numba")
+        super().__init__(butcher_table, shape, dtype)
+        self.task_params = task_params
+        self.offsets = dUdx_operator.offsets.astype(np.int64)
+        self.weights = dUdx_operator.weights
+        self.n_left = dUdx_operator.n_left
+        self.n_right = dUdx_operator.n_right
+        self.left_closure = dUdx_operator.left_closure.reshape(-1, dUdx_operator.width)
+        self.right_closure = dUdx_operator.right_closure.reshape(-1, dUdx_operator.width)
+        self.mode = _boundary_modes[dUdx_operator.boundary]
+        self._no_sigma = np.zeros((1, 1))
+
+    def combine(self, U_curr, dt, coefs, nonzero, out):
+        """ out = U_curr + dt * sum(coefs[j] * k[j]) одним проходом """
+        k = self.k.reshape((self.s, -1, self.k.shape[-1])) if self.k.ndim > 2 else self.k[:, np.newaxis, :]
+        _combine_kernel(_as_2d(U_curr), k, coefs, nonzero, dt, _as_2d(out))
+        return out
+
+    def evaluate_right_function(self, mesh, t, U, out):
+        """ k = f - sigma * U - speed * dU/dx одним проходом """
+        task_params = self.task_params
+        speed = self._broadcast(task_params.speed_function(mesh, U), U)
+        src = self._broadcast(task_params.right_function(mesh, t, U), U)
+        if task_params.stiff_coef is not None:
+            sigma = self._broadcast(task_params.stiff_coef(mesh), U)
+            use_sigma = True
+        else:
+            sigma = self._no_sigma
+            use_sigma = False
+        _right_function_kernel(_as_2d(U), speed, src, sigma, use_sigma, self.offsets, self.weights,
+                               self.n_left, self.n_right, self.left_closure, self.right_closure,
+                               self.mode, _as_2d(out))
+        self.n_rhs_calls += 1
+        return out
+
+    @staticmethod
+    def _broadcast(values, U):
+        """ Приведение результата пользовательской функции к форме (M, N) """
+        values = np.broadcast_to(np.asarray(values, dtype=np.float64), U.shape)
+        return _as_2d(values)
+
+    def step(self, U_curr, t_curr, mesh, dt, right_function=None, out=None):
+        """ Один шаг по времени (см. RungeCuttaStepper.step) """
+        if out is None:
+            out = np.empty_like(U_curr)
+        if U_curr.shape[-1] != self.k.shape[-1]:
+            self._use_length(U_curr.shape[-1])
+
+        if not self._k0_ready:
+            self.evaluate_right_function(mesh, t_curr, U_curr, self.k[0])
+        self._k0_ready = False
+
+        for i in range(1, self.s):
+            self.combine(U_curr, dt, self.a[i], self.a_nonzero[i], self.U_star)
+            t_star = t_curr + self.c[i] * dt
+            self.evaluate_right_function(mesh, t_star, self.U_star, self.k[i])
+
+        return self.combine(U_curr, dt, self.b, self.b_nonzero, out)
+
+
+jit_timings = dict()
+
+
+def warmup(space_deriv_approx_method="CD2", time_step_method="Euler-2", N=64):
+    """ Компиляция ядер на маленькой задаче и замер времени.
+
+        Первый вызов включает компиляцию (или загрузку из дискового кэша numba),
+        второй - уже скомпилированный код. Кэш на диске (cache=True) позволяет
+        не компилировать ядра заново в каждом процессе параметрического расчёта.
+
+        Выход:
+            jit_timings: dict
+                'cold' - время первого шага, с компиляцией, с
+                'warm' - время второго шага, с
+    """
+    import models
+    import SpaceDerivApproxMethods
+
+    mesh = models.Mesh(0.0, 1.0, N)
+    task_params = models.TaskParams(None,
+                                    lambda mesh, U: np.ones_like(mesh.xnodes),
+                                    lambda mesh, t, U: np.zeros_like(mesh.xnodes))
+    dUdx_operator = SpaceDerivApproxMethods.generate_dUdx_operator(space_deriv_approx_method, mesh)
+    stepper = FusedRungeCuttaStepper(RungeCuttaMethods.butcher_tables_base[time_step_method], N,
+                                     task_params, dUdx_operator)
+    U = np.sin(mesh.xnodes)
+    out = np.empty_like(U)
+    for name in ("cold", "warm"):
+        start = time.perf_counter()
+        stepper.step(U, 0.0, mesh, 1e-3, out=out)
+        jit_timings[name] = time.perf_counter() - start
+    return dict(jit_timings)
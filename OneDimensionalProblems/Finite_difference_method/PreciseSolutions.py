@@ -1,6 +1,14 @@
-import numpy as np
+import models
 
-def transport_eq_solution(init_cond, mesh, speed, total_time):
+from collections import OrderedDict
+
+# кэш точных решений: при параметрических расчётах одно и то же решение
+# нужно для всех методов на данной сетке
+_solutions_cache = OrderedDict()
+_SOLUTIONS_CACHE_SIZE = 32
+
+
+def transport_eq_solution(init_cond, mesh, speed, total_time, use_cache=True):
     """ Аналитическое решение уравнения переноса 
                     dU/dt + a * dU/dx = 0, a = const
         С начальным условием init_cond.
@@ -10,16 +18,35 @@ def transport_eq_solution(init_cond, mesh, speed, total_time):
         Вход:
             init_cond: function
                 функция одного переменного x - начальное условие
+                (скалярная или векторизованная, см. models.evaluate_init_cond)
             mesh: Mesh
                 одномерная конечно-разностная сетка, на которой решается уравнение
             speed: float
                 Параметр постоянной скорости
             total_time: float
                 Физическое время, на котором нужно вычислить решение
+            use_cache: bool
+                Использовать ли кэш решений по ключу (init_cond, сетка, speed, total_time)
         
         Выход:
             U_solution: np.array
                 Массив значений решения в узлах сетки mesh.xnodes
     """
-    U_solution = np.array([init_cond(x - speed * total_time) for x in mesh.xnodes])
-    return U_solution
\ No newline at end of file
+    key = None
+    if use_cache:
+        key = (init_cond, mesh.get_key(), speed, total_time)
+        try:
+            if key in _solutions_cache:
+                _solutions_cache.move_to_end(key)
+                return _solutions_cache[key].copy()
+        except TypeError:
+            # нехэшируемые параметры (например, массив скоростей) не кэшируем
+            key = None
+
+    U_solution = models.evaluate_init_cond(init_cond, mesh.xnodes - speed * total_time)
+
+    if key is not None:
+        _solutions_cache[key] = U_solution.copy()
+        if len(_solutions_cache) > _SOLUTIONS_CACHE_SIZE:
+            _solutions_cache.popitem(last=False)
+    return U_solution
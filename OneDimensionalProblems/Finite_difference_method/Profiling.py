@@ -0,0 +1,170 @@
+""" Замеры времени по этапам расчёта и пользовательские обработчики
+    шагов и стадий (см. аргумент profiler в utils.main_runner).
+
+    Если profiler не задан, цикл по времени не меняется: функции задачи,
+    оператор производной и методы шагателя оборачиваются таймерами только
+    при включённом замере.
+"""
+
+import copy
+import json
+import time
+import tracemalloc
+
+
+class Profiler:
+    """ Таймеры и счётчики вызовов по этапам расчёта.
+
+        Этапы (время включает вложенные этапы):
+            "step" - шаг метода целиком
+            "right_function" - правая часть целиком
+            "speed_function", "source_function", "stiff_coef", "flux_function" - функции задачи
+            "stencil" - оператор пространственной производной
+            "combine" - линейные комбинации стадий
+            "error_estimate" - оценка ошибки вложенной пары
+            "solve" - решение линейных систем неявных методов
+            "snapshot", "checkpoint" - запись на диск
+    """
+
+    def __init__(self, trace_memory=False, on_step=None, on_stage=None):
+        """
+        Вход:
+            trace_memory: bool
+                Замерять выделение памяти модулем tracemalloc (заметно замедляет расчёт)
+            on_step: function
+                Вызывается после каждого принятого шага: on_step(номер шага, t, U)
+            on_stage: function
+                Вызывается при каждом вычислении правой части: on_stage(mesh, t, U)
+        """
+        self.trace_memory = trace_memory
+        self.on_step = on_step
+        self.on_stage = on_stage
+        self.seconds = {}
+        self.calls = {}
+        self.info = {}
+        self.wall_seconds = 0.0
+        self.n_accepted = 0
+        self.n_rejected = 0
+        self.n_rhs_calls = 0
+        self.peak_memory_bytes = None
+        self.allocated_bytes = None
+        self._started_tracing = False
+
+    def add(self, name, seconds, calls=1):
+        """ Добавление времени этапа """
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def wrap(self, name, function):
+        """ Функция с тем же поведением, время вызовов которой учитывается в этапе name """
+        perf_counter = time.perf_counter
+        add = self.add
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            add(name, perf_counter() - start)
+            return result
+
+        return timed
+
+    def wrap_right_function(self, right_function):
+        """ Правая часть (mesh, t, U, ...) с таймером и обработчиком on_stage """
+        timed = self.wrap("right_function", right_function)
+        on_stage = self.on_stage
+        if on_stage is None:
+            return timed
+
+        def staged(mesh, t, U, *args):
+            on_stage(mesh, t, U)
+            return timed(mesh, t, U, *args)
+
+        return staged
+
+    def wrap_task_params(self, task_params):
+        """ Копия параметров задачи с таймерами на заданных функциях """
+        task_params = copy.copy(task_params)
+        task_params.speed_function = self.wrap("speed_function", task_params.speed_function)
+        task_params.right_function = self.wrap("source_function", task_params.right_function)
+        if task_params.stiff_coef is not None:
+            task_params.stiff_coef = self.wrap("stiff_coef", task_params.stiff_coef)
+        if task_params.flux_function is not None:
+            task_params.flux_function = self.wrap("flux_function", task_params.flux_function)
+        return task_params
+
+    def instrument_stepper(self, stepper):
+        """ Таймеры на методах шагателя (явного, IMEX или numba) """
+        stepper.step = self.wrap("step", stepper.step)
+        for attr, name in (("combine", "combine"), ("_combine", "combine"),
+                           ("error_estimate", "error_estimate"), ("_solve", "solve")):
+            if hasattr(stepper, attr):
+                setattr(stepper, attr, self.wrap(name, getattr(stepper, attr)))
+        if hasattr(stepper, "evaluate_right_function"):
+            stepper.evaluate_right_function = self.wrap_right_function(stepper.evaluate_right_function)
+        return stepper
+
+    def start(self, **info):
+        """ Начало расчёта; info - описание расчёта для отчёта """
+        self.info.update(info)
+        if self.trace_memory:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+        self._wall_start = time.perf_counter()
+
+    def step_done(self, step_num, t, U):
+        """ Обработчик принятого шага """
+        if self.on_step is not None:
+            self.on_step(step_num, t, U)
+
+    def stop(self, time_steps):
+        """ Конец расчёта: общее время, число шагов, память """
+        self.wall_seconds += time.perf_counter() - self._wall_start
+        self.n_accepted = time_steps.n_accepted
+        self.n_rejected = time_steps.n_rejected
+        self.n_rhs_calls = time_steps.n_rhs_calls
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak_memory_bytes = peak - self._memory_start
+            self.allocated_bytes = current - self._memory_start
+            if self._started_tracing:
+                tracemalloc.stop()
+
+    def report(self):
+        """ Отчёт в виде словаря, пригодного для JSON.
+
+            Выход:
+                report: dict
+                    'info' - описание расчёта, 'wall_seconds', 'steps_per_second',
+                    'n_accepted', 'n_rejected', 'n_rhs_calls',
+                    'peak_memory_bytes', 'allocated_bytes' (None без trace_memory),
+                    'phases' - {этап: {'seconds', 'calls', 'fraction'}},
+                    где fraction - доля от wall_seconds
+        """
+        wall_seconds = self.wall_seconds
+        phases = {
+            name : {
+                "seconds" : seconds,
+                "calls" : self.calls[name],
+                "fraction" : seconds / wall_seconds if wall_seconds > 0 else 0.0,
+            }
+            for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])
+        }
+        return {
+            "info" : self.info,
+            "wall_seconds" : wall_seconds,
+            "steps_per_second" : self.n_accepted / wall_seconds if wall_seconds > 0 else 0.0,
+            "n_accepted" : self.n_accepted,
+            "n_rejected" : self.n_rejected,
+            "n_rhs_calls" : self.n_rhs_calls,
+            "peak_memory_bytes" : self.peak_memory_bytes,
+            "allocated_bytes" : self.allocated_bytes,
+            "phases" : phases,
+        }
+
+    def save(self, path):
+        """ Запись отчёта в JSON """
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1)
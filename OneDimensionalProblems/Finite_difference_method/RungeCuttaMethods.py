@@ -5,16 +5,27 @@
         U - массив решения 
         mesh - одномерная сетка на которой ищется решение
         t - параметр времени
+
+    Для жёстких задач есть неявно-явные (IMEX) методы для задачи
+                dU/dt = F(U, mesh, t) + L U
+    где L - постоянная разреженная матрица, которая обрабатывается неявно.
 """
 
 import numpy as np
 
+try:
+    import scipy.sparse
+    import scipy.sparse.linalg
+except ImportError:
+    scipy = None
+
 def runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table):
     """ Общее описание метода Рунге-Кутты
 
         Вход:
         U_curr: np.array
-            Массив текущего решения во всех узал расчёной сетки
+            Массив текущего решения во всех узал расчёной сетки.
+            Может иметь форму (n_members, N) - набор независимых решений
         t_curr: float
             Текущее время
         mesh: Mesh
@@ -34,94 +45,563 @@ def runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher
                 массив значений на новом временном слое
     """
     s = butcher_table['c'].shape[0]    # количество слоёв по времени
-    k = np.zeros((s, U_curr.shape[0])) # список решений на промежуточных 
-                                       # вспомогательных временных слоях
+    k = np.zeros((s,) + U_curr.shape) # список решений на промежуточных 
+                                      # вспомогательных временных слоях
+    coef_shape = (-1,) + (1,) * U_curr.ndim
 
     k[0] = right_function(mesh, t_curr, U_curr)
     for i in range(1, s):
         a = np.array(butcher_table['a'][i-1])
-        U_star = U_curr + dt * np.sum(a[:i].reshape((-1, 1)) * k[:i], axis=0)
-        t_star = t_curr + butcher_table['c'] * dt
+        U_star = U_curr + dt * np.sum(a[:i].reshape(coef_shape) * k[:i], axis=0)
+        t_star = t_curr + butcher_table['c'][i] * dt
         k[i] = right_function(mesh, t_star, U_star)
   
     b = butcher_table['b']
-    U_new = U_curr + dt*np.sum(b.reshape((-1, 1))*k, axis=0)
+    U_new = U_curr + dt*np.sum(b.reshape(coef_shape)*k, axis=0)
     return U_new
 
 
+butcher_tables_base = {
+    "Euler-1" : {
+        'c' : np.array([0]),
+        'b' : np.array([1.0]),
+        'a' : [np.array([0.0]),
+              ]
+    },
+    "Euler-2" : {
+        'c' : np.array([0, 0.5]),
+        'b' : np.array([0, 1.0]),
+        'a' : [np.array([0.5]),
+              ]
+    },
+    "Hoin" : {
+        'c' : np.array([0, 1/3, 2/3]),
+        'b' : np.array([1/4, 0, 3/4]),
+        'a' : [np.array([1/3]),
+               np.array([0, 2/3])
+              ]
+    },
+    "RK-6" : {
+        'c' : np.array([0, 1/3, 2/3, 1/3, 5/6, 1/6, 1]),
+        'b' : np.array([13/200, 0, 11/40, 11/40, 4/25, 4/25, 13/200]),
+        'a' : [np.array([1/3]),
+               np.array([0, 2/3]),
+               np.array([1/12, 1/3, -1/12]),
+               np.array([25/48, -55/24, 35/48, 15/8]),
+               np.array([3/20, -11/24, -1/8, 1/2, 1/10]),
+               np.array([-261/260, 33/13, 43/156, -118/39, 32/195, 80/39]),
+              ]
+    },
+    "RK-7" : {
+        'c' : np.array([0, 1/6, 1/3, 1/2, 2/11, 2/3, 6/7, 0, 1]),
+        'b' : np.array([0, 0, 0, 32/105, 1771561/6289920, 243/2560, 16807/74880, 77/1440, 11/270]),
+        'a' : [np.array([1/6]),
+               np.array([0, 1/3]),
+               np.array([1/8, 0, 3/8]),
+               np.array([148/1331, 0, 150/1331, -56/1331]),
+               np.array([-404/243, 0, -170/27, 4024/1701, 10648/1701]),
+               np.array([2466/2401, 0, 1242/343, -19176/16807, -51909/16807, 1053/2401]),
+               np.array([5/154, 0, 0, 96/539, -1815/20384, -405/2464, 49/1144]),
+               np.array([-113/32, 0, -195/22, 32/7, 29403/3584, -729/512, 1029/1408, 21/16]),
+               ]
+    },
+    # вложенные пары: 'b' - решение старшего порядка,
+    # 'b_hat' - решение младшего порядка 'embedded_order',
+    # разность между ними даёт оценку локальной ошибки
+    "BS-32" : {
+        'c' : np.array([0, 1/2, 3/4, 1]),
+        'b' : np.array([2/9, 1/3, 4/9, 0]),
+        'b_hat' : np.array([7/24, 1/4, 1/3, 1/8]),
+        'a' : [np.array([1/2]),
+               np.array([0, 3/4]),
+               np.array([2/9, 1/3, 4/9]),
+              ],
+        'embedded_order' : 2,
+        'fsal' : True,
+    },
+    "DP-54" : {
+        'c' : np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1]),
+        'b' : np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0]),
+        'b_hat' : np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40]),
+        'a' : [np.array([1/5]),
+               np.array([3/40, 9/40]),
+               np.array([44/45, -56/15, 32/9]),
+               np.array([19372/6561, -25360/2187, 64448/6561, -212/729]),
+               np.array([9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]),
+               np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]),
+              ],
+        'embedded_order' : 4,
+        'fsal' : True,
+    },
+    # методы, сохраняющие сильную устойчивость (SSP) в форме Шу-Ошера:
+    # выпуклые комбинации шагов явного Эйлера, поэтому не нарушают
+    # свойство TVD пространственной аппроксимации при Cu <= 1
+    "SSP-RK2" : {
+        'c' : np.array([0, 1]),
+        'b' : np.array([1/2, 1/2]),
+        'a' : [np.array([1.0]),
+              ]
+    },
+    "SSP-RK3" : {
+        'c' : np.array([0, 1, 1/2]),
+        'b' : np.array([1/6, 1/6, 2/3]),
+        'a' : [np.array([1.0]),
+               np.array([1/4, 1/4]),
+              ]
+    },
+}
+
+
 def direct_euler(U_curr, t_curr, mesh, dt, right_function):
     """ Прямой метод Эйлера
     """
-    butcher_table = {
-        'c' : np.array([0], dtype=np.float32),
-        'b' : np.array([1.0], dtype=np.float32),
-        'a' : [np.array([0.0]),
-              ]
-    }
+    butcher_table = butcher_tables_base["Euler-1"]
     return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
 
 
 def two_step_euler(U_curr, t_curr, mesh, dt, right_function):
     """ Двухшаговый метод Эйлера
     """
-    butcher_table = {
-        'c' : np.array([0, 0.5], dtype=np.float32),
-        'b' : np.array([0, 1.0], dtype=np.float32),
-        'a' : [np.array([0.5]),
-              ]
-    }
+    butcher_table = butcher_tables_base["Euler-2"]
     return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
 
 
 def hoin(U_curr, t_curr, mesh, dt, right_function):
     """ Трёхшаговый метод Хойна
     """
-    butcher_table = {
-        'c' : np.array([0, 1/3, 2/3], dtype=np.float32),
-        'b' : np.array([1/4, 0, 3/4], dtype=np.float32),
-        'a' : [np.array([1/3]),
-               np.array([0, 2/3])
-              ]
-    }
+    butcher_table = butcher_tables_base["Hoin"]
     return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
 
 
 def runge_cutta_6(U_curr, t_curr, mesh, dt, right_function):
     """ Метод Рунге-Кутты 6-го порядка
     """
-    butcher_table = {
-        'c' : np.array([0, 1/3, 2/3, 1/3, 5/6, 1/6, 1], dtype=np.float32),
-        'b' : np.array([13/200, 0, 11/40, 11/40, 4/25, 4/25, 13/200], dtype=np.float32),
-        'a' : [np.array([1/3]),
-               np.array([0, 2/3]),
-               np.array([1/12, 1/3, -1/12]),
-               np.array([25/48, -55/24, 35/48, 15/8]),
-               np.array([3/20, -11/24, -1/8, 1/2, 1/10]),
-               np.array([-261/260, 33/13, 43/156, -118/39, 32/195, 80/39]),
-              ]
-    }
+    butcher_table = butcher_tables_base["RK-6"]
     return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
 
 
 def runge_cutta_7(U_curr, t_curr, mesh, dt, right_function):
     """ Метод Ренге-Кутты 7-го порядка
     """
-    butcher_table = {
-        'c' : np.array([0, 1/6, 1/3, 1/2, 2/11, 2/3, 6/7, 0, 1], dtype=np.float32),
-        'b' : np.array([0, 0, 0, 32/105, 1771561/6289920, 243/2560, 16807/74880, 77/1440, 11/270], dtype=np.float32),
-        'a' : [np.array([1/6]),
-               np.array([0, 1/3]),
-               np.array([1/8, 0, 3/8]),
-               np.array([148/1331, 0, 150/1331, -56/1331]),
-               np.array([-404/243, 0, -170/27, 4024/1701, 10648/1701]),
-               np.array([2466/2401, 0, 1242/343, -19176/16807, -51909/16807, 1053/2401]),
-               np.array([5/154, 0, 0, 96/539, -1815/20384, -405/2464, 49/1144]),
-               np.array([-113/32, 0, -195/22, 32/7, 29403/3584, -729/512, 1029/1408, 21/16]),
-               ]
-    }
+    butcher_table = butcher_tables_base["RK-7"]
+    return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
+
+
+def bogacki_shampine(U_curr, t_curr, mesh, dt, right_function):
+    """ Метод Богацкого-Шампина 3-го порядка (пара 3(2))
+    """
+    butcher_table = butcher_tables_base["BS-32"]
+    return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
+
+
+def dormand_prince(U_curr, t_curr, mesh, dt, right_function):
+    """ Метод Дормана-Принса 5-го порядка (пара 5(4))
+    """
+    butcher_table = butcher_tables_base["DP-54"]
+    return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
+
+
+def ssp_rk2(U_curr, t_curr, mesh, dt, right_function):
+    """ SSP метод Рунге-Кутты 2-го порядка
+    """
+    butcher_table = butcher_tables_base["SSP-RK2"]
     return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
 
 
+def ssp_rk3(U_curr, t_curr, mesh, dt, right_function):
+    """ SSP метод Рунге-Кутты 3-го порядка
+    """
+    butcher_table = butcher_tables_base["SSP-RK3"]
+    return runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, butcher_table)
+
+
+class RungeCuttaStepper:
+    """ Явный метод Рунге-Кутты с заранее выделенной памятью.
+
+        Таблица Бутчера переводится в float64 один раз при создании,
+        массивы промежуточных слоёв k тоже создаются один раз,
+        а шаг по времени записывает результат в переданный массив out.
+        Поэтому один объект создаётся на весь расчёт и не выделяет память
+        на каждом шаге.
+
+        Слои k и промежуточное решение хранятся в типе dtype (например,
+        float32 - вдвое меньше памяти и обращений к ней), а суммы стадий
+        всегда накапливаются в float64 и округляются один раз при записи в out.
+    """
+
+    def __init__(self, butcher_table, shape, dtype=np.float64, k=None, U_star=None):
+        """
+        Вход:
+            butcher_table: dict
+                Таблица Бутчера в формате runge_cutta_general_method
+            shape : int или tuple
+                Форма массива решения: число узлов сетки N
+                или (n_members, N) для набора решений
+            dtype : np.dtype
+                Тип хранения слоёв k и решения: np.float64 или np.float32
+            k : np.array
+                Готовый массив слоёв формы (s,) + shape типа dtype,
+                например участок общей памяти; если не задан, выделяется свой
+            U_star : np.array
+                Готовый массив промежуточного слоя формы shape типа dtype
+        """
+        self.c = np.asarray(butcher_table['c'], dtype=np.float64)
+        self.b = np.asarray(butcher_table['b'], dtype=np.float64)
+        self.s = self.c.shape[0]
+
+        # нижнетреугольная матрица коэффициентов: строка i - коэффициенты
+        # для вычисления i-го промежуточного слоя
+        self.a = np.zeros((self.s, self.s))
+        for i in range(1, self.s):
+            row = np.asarray(butcher_table['a'][i-1], dtype=np.float64)[:i]
+            self.a[i, :row.shape[0]] = row
+
+        # нулевые коэффициенты пропускаем, чтобы не делать лишних проходов
+        self.a_nonzero = [np.flatnonzero(self.a[i]) for i in range(self.s)]
+        self.b_nonzero = np.flatnonzero(self.b)
+
+        # коэффициенты оценки ошибки для вложенных пар
+        self.embedded = 'b_hat' in butcher_table
+        if self.embedded:
+            b_hat = np.asarray(butcher_table['b_hat'], dtype=np.float64)
+            self.e = self.b - b_hat
+            self.e_nonzero = np.flatnonzero(self.e)
+            self.embedded_order = butcher_table['embedded_order']
+
+        # First Same As Last: последний слой принятого шага совпадает
+        # с первым слоем следующего, его можно не вычислять повторно
+        self.fsal = butcher_table.get('fsal', False)
+        self._k0_ready = False
+        self.n_rhs_calls = 0
+
+        shape = tuple(np.atleast_1d(shape))
+        self.dtype = np.dtype(dtype)
+        self._k_full = np.empty((self.s,) + shape, dtype=self.dtype) if k is None else k
+        self._U_star_full = np.empty(shape, dtype=self.dtype) if U_star is None else U_star
+        # суммы стадий - в float64 независимо от dtype
+        self._acc_full = np.empty(shape)
+        self._tmp_full = np.empty(shape)
+        self._use_length(shape[-1])
+
+    def _use_length(self, n):
+        """ Рабочие массивы - первые n узлов полных буферов.
+            Позволяет делать шаг на части сетки (активном окне) без выделения памяти.
+        """
+        self.k = self._k_full[..., :n]
+        self.U_star = self._U_star_full[..., :n]
+        self._acc = self._acc_full[..., :n]
+        self._tmp = self._tmp_full[..., :n]
+        self._k0_ready = False
+
+    def reset_first_stage(self):
+        """ Сбрасывает сохранённый первый слой FSAL-метода,
+            например, если следующий шаг делается на другом участке сетки.
+        """
+        self._k0_ready = False
+
+    def combine(self, U_curr, dt, coefs, nonzero, out):
+        """ Вычисляет out = U_curr + dt * sum(coefs[j] * k[j])
+            без создания временных массивов.
+        """
+        if nonzero.shape[0] == 0:
+            np.copyto(out, U_curr)
+            return out
+
+        acc, tmp = self._acc, self._tmp
+        np.multiply(self.k[nonzero[0]], coefs[nonzero[0]], out=acc)
+        for j in nonzero[1:]:
+            np.multiply(self.k[j], coefs[j], out=tmp)
+            acc += tmp
+        acc *= dt
+        np.add(U_curr, acc, out=out)
+        return out
+
+    def error_estimate(self, dt, out):
+        """ Оценка локальной ошибки последнего шага вложенной пары:
+                out = dt * sum((b[j] - b_hat[j]) * k[j])
+            Использует уже вычисленные слои k, правая часть не вызывается.
+        """
+        acc = out if out.dtype == self._acc.dtype else self._acc
+        np.multiply(self.k[self.e_nonzero[0]], self.e[self.e_nonzero[0]], out=acc)
+        for j in self.e_nonzero[1:]:
+            np.multiply(self.k[j], self.e[j], out=self._tmp)
+            acc += self._tmp
+        acc *= dt
+        if acc is not out:
+            np.copyto(out, acc)
+        return out
+
+    def accept(self):
+        """ Сообщает, что последний шаг принят.
+            Для FSAL-методов последний слой становится первым слоем следующего шага.
+        """
+        if self.fsal:
+            self.k[0] = self.k[self.s - 1]
+            self._k0_ready = True
+        else:
+            self._k0_ready = False
+
+    def reject(self):
+        """ Сообщает, что последний шаг отвергнут.
+            Решение U_curr не изменилось, поэтому первый слой k[0] остаётся верным.
+        """
+        self._k0_ready = True
+
+    def step(self, U_curr, t_curr, mesh, dt, right_function, out=None):
+        """ Один шаг по времени.
+
+            Вход:
+                U_curr, t_curr, mesh, dt, right_function:
+                    как в runge_cutta_general_method
+                out: np.array
+                    Массив, в который записывается решение на новом слое.
+                    Не должен совпадать с U_curr.
+                    Если не задан, создаётся новый массив.
+
+            Выход:
+                out: np.array
+                    массив значений на новом временном слое
+        """
+        if out is None:
+            out = np.empty_like(U_curr)
+        if U_curr.shape[-1] != self.k.shape[-1]:
+            self._use_length(U_curr.shape[-1])
+
+        if not self._k0_ready:
+            self.k[0] = right_function(mesh, t_curr, U_curr)
+            self.n_rhs_calls += 1
+        self._k0_ready = False
+
+        for i in range(1, self.s):
+            self.combine(U_curr, dt, self.a[i], self.a_nonzero[i], self.U_star)
+            t_star = t_curr + self.c[i] * dt
+            self.k[i] = right_function(mesh, t_star, self.U_star)
+            self.n_rhs_calls += 1
+
+        return self.combine(U_curr, dt, self.b, self.b_nonzero, out)
+
+
+_gamma = 1 - 1 / np.sqrt(2)
+_delta = 1 - 1 / (2 * _gamma)
+
+# L-устойчивая пара ARS(2,2,2) 2-го порядка
+_ars222_table = {
+    'c' : np.array([0, _gamma, 1]),
+    'explicit' : {'a' : np.array([[0, 0, 0],
+                                  [_gamma, 0, 0],
+                                  [_delta, 1 - _delta, 0]]),
+                  'b' : np.array([_delta, 1 - _delta, 0])},
+    'implicit' : {'a' : np.array([[0, 0, 0],
+                                  [0, _gamma, 0],
+                                  [0, 1 - _gamma, _gamma]]),
+                  'b' : np.array([0, 1 - _gamma, _gamma])},
+}
+
+# Таблицы IMEX-методов: пара таблиц Бутчера с общим 'c'.
+# 'explicit' - явная таблица для F, 'implicit' - диагонально-неявная таблица для L.
+# Матрицы 'a' заданы полностью (s x s).
+# 'implicit_advection' - обрабатывать ли неявно перенос (speed * dU/dx)
+# вместе с жёстким источником, или только жёсткий источник.
+imex_tables_base = {
+    "IMEX-Euler" : {
+        'c' : np.array([0, 1]),
+        'explicit' : {'a' : np.array([[0, 0],
+                                      [1, 0]]),
+                      'b' : np.array([1, 0])},
+        'implicit' : {'a' : np.array([[0, 0],
+                                      [0, 1]]),
+                      'b' : np.array([0, 1])},
+        'implicit_advection' : False,
+    },
+    "CN" : {
+        'c' : np.array([0, 1]),
+        'explicit' : {'a' : np.array([[0, 0],
+                                      [1, 0]]),
+                      'b' : np.array([1/2, 1/2])},
+        'implicit' : {'a' : np.array([[0, 0],
+                                      [1/2, 1/2]]),
+                      'b' : np.array([1/2, 1/2])},
+        'implicit_advection' : True,
+    },
+    # одна и та же пара таблиц ARS(2,2,2): перенос неявно или явно
+    "SDIRK-2" : {**_ars222_table, 'implicit_advection' : True},
+    "IMEX-ARS222" : {**_ars222_table, 'implicit_advection' : False},
+}
+
+
+class ImexRungeCuttaStepper:
+    """ Неявно-явный (IMEX) метод Рунге-Кутты для задачи
+                dU/dt = F(U, mesh, t) + L U
+
+        F вычисляется явно, L U - неявно. На каждой стадии решается система
+                (I - dt * a_ii * L) Y_i = правая часть,
+        LU-разложение матрицы (I - dt * a_ii * L) вычисляется один раз
+        и переиспользуется, пока не изменится dt.
+        Тип хранения dtype и накопление сумм стадий - как в RungeCuttaStepper.
+    """
+
+    _max_factors = 4   # сколько разложений хранить (разные dt и a_ii)
+
+    def __init__(self, imex_table, shape, implicit_operator, dtype=np.float64):
+        """
+        Вход:
+            imex_table: dict
+                Таблица в формате imex_tables_base
+            shape : int или tuple
+                Форма массива решения: N или (n_members, N)
+            implicit_operator: scipy.sparse matrix
+                Матрица L размера (N, N)
+            dtype : np.dtype
+                Тип хранения слоёв и решения: np.float64 или np.float32
+        """
+        if scipy is None:
+            raise ImportError("Для неявных методов нужен пакет scipy")
+        self.c = np.asarray(imex_table['c'], dtype=np.float64)
+        self.s = self.c.shape[0]
+        self.a_E = np.asarray(imex_table['explicit']['a'], dtype=np.float64)
+        self.b_E = np.asarray(imex_table['explicit']['b'], dtype=np.float64)
+        self.a_I = np.asarray(imex_table['implicit']['a'], dtype=np.float64)
+        self.b_I = np.asarray(imex_table['implicit']['b'], dtype=np.float64)
+
+        # слои, которые потом нигде не используются, не вычисляются
+        self.need_E = (np.tril(self.a_E, -1) != 0).any(axis=0) | (self.b_E != 0)
+        self.need_I = (np.tril(self.a_I, -1) != 0).any(axis=0) | (self.b_I != 0)
+
+        self.L = scipy.sparse.csr_matrix(implicit_operator)
+        self.identity = scipy.sparse.identity(self.L.shape[0], format='csr')
+        self._factors = {}
+
+        shape = tuple(np.atleast_1d(shape))
+        self.dtype = np.dtype(dtype)
+        self.k_E = np.empty((self.s,) + shape, dtype=self.dtype)
+        self.k_I = np.empty((self.s,) + shape, dtype=self.dtype)
+        self.U_star = np.empty(shape, dtype=self.dtype)
+        self._acc = np.empty(shape)
+        self._tmp = np.empty(shape)
+
+        self.embedded = False
+        self.n_rhs_calls = 0
+        self.n_factorizations = 0
+
+    def _solve(self, coef, rhs):
+        """ Решение (I - coef * L) Y = rhs с кэшированием разложения """
+        factor = self._factors.get(coef)
+        if factor is None:
+            if len(self._factors) >= self._max_factors:
+                self._factors.clear()
+            matrix = (self.identity - coef * self.L).tocsc()
+            factor = self._factors[coef] = scipy.sparse.linalg.splu(matrix)
+            self.n_factorizations += 1
+        if rhs.ndim == 1:
+            return factor.solve(rhs)
+        return factor.solve(np.ascontiguousarray(rhs.T)).T
+
+    def _apply_L(self, U, out):
+        if U.ndim == 1:
+            out[...] = self.L @ U
+        else:
+            out[...] = (self.L @ U.T).T
+        return out
+
+    def _combine(self, U_curr, dt, coefs_E, coefs_I, out):
+        """ out = U_curr + dt * sum(coefs_E[j] * k_E[j] + coefs_I[j] * k_I[j]) """
+        acc = out if out.dtype == self._acc.dtype else self._acc
+        np.copyto(acc, U_curr)
+        for j in np.flatnonzero(coefs_E):
+            np.multiply(self.k_E[j], dt * coefs_E[j], out=self._tmp)
+            acc += self._tmp
+        for j in np.flatnonzero(coefs_I):
+            np.multiply(self.k_I[j], dt * coefs_I[j], out=self._tmp)
+            acc += self._tmp
+        if acc is not out:
+            np.copyto(out, acc)
+        return out
+
+    def step(self, U_curr, t_curr, mesh, dt, right_function, out=None):
+        """ Один шаг по времени.
+
+            Вход:
+                right_function: function
+                    Явная часть F(mesh, t, U)
+                остальные аргументы - как в RungeCuttaStepper.step
+
+            Выход:
+                out: np.array
+                    массив значений на новом временном слое
+        """
+        if out is None:
+            out = np.empty_like(U_curr)
+
+        for i in range(self.s):
+            self._combine(U_curr, dt, self.a_E[i, :i], self.a_I[i, :i], self.U_star)
+            a_ii = self.a_I[i, i]
+            if a_ii != 0:
+                self.U_star[...] = self._solve(dt * a_ii, self.U_star)
+            t_star = t_curr + self.c[i] * dt
+            if self.need_E[i]:
+                self.k_E[i] = right_function(mesh, t_star, self.U_star)
+                self.n_rhs_calls += 1
+            if self.need_I[i]:
+                self._apply_L(self.U_star, self.k_I[i])
+
+        return self._combine(U_curr, dt, self.b_E, self.b_I, out)
+
+    def accept(self):
+        pass
+
+    def reject(self):
+        pass
+
+
+def imex_runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, implicit_operator, imex_table):
+    """ Общее описание IMEX-метода Рунге-Кутты для задачи
+                dU/dt = right_function(mesh, t, U) + implicit_operator @ U
+
+        Разложение матрицы строится заново при каждом вызове,
+        поэтому для многих шагов выгоднее ImexRungeCuttaStepper.
+
+        Вход:
+            implicit_operator: scipy.sparse matrix
+                Матрица L, обрабатываемая неявно
+            imex_table: dict
+                Таблица в формате imex_tables_base
+            остальные аргументы - как в runge_cutta_general_method
+
+        Выход:
+            U_new: np.array
+                массив значений на новом временном слое
+    """
+    stepper = ImexRungeCuttaStepper(imex_table, U_curr.shape, implicit_operator)
+    return stepper.step(U_curr, t_curr, mesh, dt, right_function)
+
+
+def imex_euler(U_curr, t_curr, mesh, dt, right_function, implicit_operator):
+    """ Неявно-явный метод Эйлера 1-го порядка
+    """
+    imex_table = imex_tables_base["IMEX-Euler"]
+    return imex_runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, implicit_operator, imex_table)
+
+
+def crank_nicolson(U_curr, t_curr, mesh, dt, right_function, implicit_operator):
+    """ Метод Кранка-Николсон 2-го порядка (явная часть - метод Хойна)
+    """
+    imex_table = imex_tables_base["CN"]
+    return imex_runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, implicit_operator, imex_table)
+
+
+def sdirk_2(U_curr, t_curr, mesh, dt, right_function, implicit_operator):
+    """ L-устойчивый SDIRK-метод 2-го порядка (ARS(2,2,2)), перенос обрабатывается неявно
+    """
+    imex_table = imex_tables_base["SDIRK-2"]
+    return imex_runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, implicit_operator, imex_table)
+
+
+def imex_ars222(U_curr, t_curr, mesh, dt, right_function, implicit_operator):
+    """ Неявно-явный метод ARS(2,2,2) 2-го порядка, перенос обрабатывается явно
+    """
+    imex_table = imex_tables_base["IMEX-ARS222"]
+    return imex_runge_cutta_general_method(U_curr, t_curr, mesh, dt, right_function, implicit_operator, imex_table)
+
 
 runge_cutta_funcions_base = {
     "Euler-1" : direct_euler,
@@ -129,8 +609,34 @@ runge_cutta_funcions_base = {
     "Hoin" : hoin,
     "RK-6" : runge_cutta_6,
     "RK-7" : runge_cutta_7,
+    "BS-32" : bogacki_shampine,
+    "DP-54" : dormand_prince,
+    "SSP-RK2" : ssp_rk2,
+    "SSP-RK3" : ssp_rk3,
 }
 
+imex_funcions_base = {
+    "IMEX-Euler" : imex_euler,
+    "CN" : crank_nicolson,
+    "SDIRK-2" : sdirk_2,
+    "IMEX-ARS222" : imex_ars222,
+}
+
+
+def is_implicit(time_step_method):
+    """ Является ли метод неявно-явным (требует матрицу implicit_operator)
+    """
+    return time_step_method in imex_tables_base
+
+
+def get_stages_number(time_step_method):
+    """ Число стадий метода (явного или неявно-явного)
+    """
+    if is_implicit(time_step_method):
+        return imex_tables_base[time_step_method]['c'].shape[0]
+    return butcher_tables_base[time_step_method]['c'].shape[0]
+
+
 def generate_get_next_function(time_step_method):
     """ Возвращает функцию, которая по решению на текущем временном слое
         возвращает решение на следующем временном слое.
@@ -146,5 +652,31 @@ def generate_get_next_function(time_step_method):
                     - сетку, на которой вычисляется решение
                     - шаг по времени
                     - функцию правых частей, зависящую от mesh, t, U
+                Для неявных методов (см. is_implicit) пятым аргументом
+                передаётся матрица implicit_operator.
+    """
+    if is_implicit(time_step_method):
+        return imex_funcions_base[time_step_method]
+    return runge_cutta_funcions_base[time_step_method]
+
+
+def generate_stepper(time_step_method, shape, implicit_operator=None, dtype=np.float64):
+    """ Создаёт объект, совершающий шаги по времени выбранным методом.
+
+        Вход:
+            time_step_method: str
+                Название метода аппроксимации временной производной
+            shape : int или tuple
+                Форма массива решения: N или (n_members, N)
+            implicit_operator: scipy.sparse matrix
+                Матрица L, обрабатываемая неявно (только для неявных методов)
+            dtype : np.dtype
+                Тип хранения слоёв и решения: np.float64 или np.float32
+
+        Выход:
+            stepper: RungeCuttaStepper или ImexRungeCuttaStepper
+                Объект с методом step(U_curr, t_curr, mesh, dt, right_function, out)
     """
-    return runge_cutta_funcions_base[time_step_method]
\ No newline at end of file
+    if is_implicit(time_step_method):
+        return ImexRungeCuttaStepper(imex_tables_base[time_step_method], shape, implicit_operator, dtype)
+    return RungeCuttaStepper(butcher_tables_base[time_step_method], shape, dtype)
@@ -0,0 +1,249 @@
+""" Запись решения во время расчёта на диск и ленивое чтение истории.
+
+    Снимки решения пишутся в заранее созданный файл фиксированного размера
+    (np.memmap в формате .npy или, если установлен h5py, набор данных HDF5),
+    поэтому память, занимаемая историей, не растёт с длиной расчёта.
+"""
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+def _get_paths(path):
+    """ Файлы хранилища .npy: значения, моменты времени, координаты узлов """
+    return path + ".npy", path + ".times.npy", path + ".x.npy"
+
+
+class SnapshotWriter:
+    """ Запись снимков решения каждые every_steps шагов или каждые every_time
+        единиц физического времени, с прореживанием по пространству.
+    """
+
+    def __init__(self, path, mesh, n_snapshots, every_steps=None, every_time=None, x_stride=1,
+                 n_members=None, backend="npy"):
+        """
+        Вход:
+            path: str
+                Путь к хранилищу без расширения. Для backend "npy" создаются
+                файлы path.npy, path.times.npy и path.x.npy, для "hdf5" - path.h5
+            mesh: Mesh
+                Сетка, на которой решается задача
+            n_snapshots: int
+                Максимальное число снимков; лишние снимки не записываются
+            every_steps: int
+                Записывать каждый every_steps-й шаг
+            every_time: float
+                Записывать не чаще, чем раз в every_time единиц времени
+            x_stride: int
+                Прореживание по пространству: сохраняется каждый x_stride-й узел
+            n_members: int
+                Число решений в наборе (см. utils.ensemble_runner); None - одно решение
+            backend: str
+                "npy" (np.memmap) или "hdf5" (нужен пакет h5py)
+        """
+        if every_steps is None and every_time is None:
+            raise ValueError("Нужно задать every_steps или every_time")
+        self.every_steps = every_steps
+        self.every_time = every_time
+        self.x_stride = x_stride
+        self.n_snapshots = n_snapshots
+        self.n_written = 0
+        self._next_time = 0.0
+
+        x = mesh.xnodes[::x_stride]
+        member_shape = () if n_members is None else (n_members,)
+        shape = (n_snapshots,) + member_shape + (x.shape[0],)
+
+        self.backend = backend
+        if backend == "npy":
+            U_path, times_path, x_path = _get_paths(path)
+            np.save(x_path, x)
+            self._U = np.lib.format.open_memmap(U_path, mode="w+", dtype=np.float64, shape=shape)
+            self._times = np.lib.format.open_memmap(times_path, mode="w+", dtype=np.float64,
+                                                    shape=(n_snapshots,))
+            self._times[:] = np.nan
+            self._file = None
+        elif backend == "hdf5":
+            if h5py is None:
+                raise ImportError("Для записи в HDF5 нужен пакет h5py")
+            self._file = h5py.File(path + ".h5", "w")
+            self._file.create_dataset("x", data=x)
+            self._U = self._file.create_dataset("U", shape=shape, dtype=np.float64,
+                                                chunks=(1,) + shape[1:])
+            self._times = self._file.create_dataset("t", shape=(n_snapshots,), dtype=np.float64,
+                                                    fillvalue=np.nan)
+        else:
+            raise ValueError(f"Неизвестный формат хранилища: {backend}")
+
+    def maybe_write(self, step_num, t, U):
+        """ Запись снимка, если пришло его время.
+
+            Вход:
+                step_num: int
+                    Номер принятого шага (0 - начальное условие)
+                t: float
+                    Текущее время
+                U: np.array
+                    Текущее решение
+
+            Выход:
+                written: bool
+                    Был ли записан снимок
+        """
+        if self.n_written >= self.n_snapshots:
+            return False
+        due = False
+        if self.every_steps is not None and step_num % self.every_steps == 0:
+            due = True
+        if self.every_time is not None and t >= self._next_time:
+            due = True
+            # следующий момент записи - ближайший кратный every_time после t
+            self._next_time = (np.floor(t / self.every_time + 1e-9) + 1) * self.every_time
+        if not due:
+            return False
+        self.write(t, U)
+        return True
+
+    def write(self, t, U):
+        """ Безусловная запись снимка """
+        self._U[self.n_written] = U[..., ::self.x_stride]
+        self._times[self.n_written] = t
+        self.n_written += 1
+
+    def close(self):
+        """ Сброс данных на диск и закрытие хранилища """
+        if self.backend == "npy":
+            self._U.flush()
+            self._times.flush()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _normalize_snapshot_index(index, n_snapshots):
+    """ Индекс по снимкам, приведённый к записанным снимкам: неотрицательное
+        целое, срез с явными границами или массив номеров. Выход за границы
+        вызывает IndexError, как у массивов numpy
+    """
+    if isinstance(index, slice):
+        start, stop, step = index.indices(n_snapshots)
+        if step < 0 and stop < 0:
+            stop = None
+        return slice(start, stop, step)
+    if isinstance(index, (int, np.integer)):
+        if not -n_snapshots <= index < n_snapshots:
+            raise IndexError(f"Номер снимка {index} вне диапазона для {n_snapshots} снимков")
+        return int(index) % n_snapshots
+    index = np.asarray(index)
+    if index.dtype == bool:
+        if index.shape != (n_snapshots,):
+            raise IndexError(f"Маска снимков длины {len(index)} не совпадает с числом снимков {n_snapshots}")
+        return np.flatnonzero(index)
+    if not np.issubdtype(index.dtype, np.integer):
+        raise IndexError(f"Неподдерживаемый индекс снимков: {index!r}")
+    if np.any((index < -n_snapshots) | (index >= n_snapshots)):
+        raise IndexError(f"Номера снимков вне диапазона для {n_snapshots} снимков")
+    return index % n_snapshots if n_snapshots else index
+
+
+class SnapshotReader:
+    """ Ленивое чтение истории, записанной SnapshotWriter.
+        Данные читаются с диска только для запрошенных срезов.
+    """
+
+    def __init__(self, path, backend="npy"):
+        """
+        Вход:
+            path: str
+                Путь к хранилищу без расширения (как в SnapshotWriter)
+            backend: str
+                "npy" или "hdf5"
+        """
+        self.backend = backend
+        if backend == "npy":
+            U_path, times_path, x_path = _get_paths(path)
+            self.U = np.load(U_path, mmap_mode="r")
+            times = np.load(times_path)
+            self.x = np.load(x_path)
+            self._file = None
+        elif backend == "hdf5":
+            if h5py is None:
+                raise ImportError("Для чтения HDF5 нужен пакет h5py")
+            self._file = h5py.File(path + ".h5", "r")
+            self.U = self._file["U"]
+            times = self._file["t"][:]
+            self.x = self._file["x"][:]
+        else:
+            raise ValueError(f"Неизвестный формат хранилища: {backend}")
+        # незаполненные снимки имеют время nan
+        self.n_snapshots = int(np.count_nonzero(~np.isnan(times)))
+        self.times = times[:self.n_snapshots]
+
+    def window(self, t_min=-np.inf, t_max=np.inf, x_min=-np.inf, x_max=np.inf):
+        """ Срез истории по времени и пространству.
+
+            Вход:
+                t_min, t_max: float
+                    Границы отрезка времени
+                x_min, x_max: float
+                    Границы отрезка пространства
+
+            Выход:
+                times: np.array
+                    Моменты времени снимков
+                x: np.array
+                    Координаты сохранённых узлов
+                U: np.array
+                    Значения формы (len(times), [n_members,] len(x))
+        """
+        t_start = np.searchsorted(self.times, t_min, side="left")
+        t_finish = np.searchsorted(self.times, t_max, side="right")
+        x_start = np.searchsorted(self.x, x_min, side="left")
+        x_finish = np.searchsorted(self.x, x_max, side="right")
+        U = np.asarray(self.U[t_start:t_finish, ..., x_start:x_finish])
+        return self.times[t_start:t_finish], self.x[x_start:x_finish], U
+
+    def __getitem__(self, index):
+        """ Произвольный срез по индексам (снимок, [член набора,] узел).
+            Индекс по снимкам проверяется по числу записанных снимков, а набор
+            данных HDF5 читается только в выбранной части
+        """
+        if not isinstance(index, tuple):
+            index = (index,)
+        if len(index) == 0 or index[0] is Ellipsis:
+            index = (slice(None),) + index
+        first, rest = _normalize_snapshot_index(index[0], self.n_snapshots), index[1:]
+        if self._file is None:
+            return np.asarray(self.U[:self.n_snapshots][(first,) + rest])
+
+        # h5py принимает только срезы с положительным шагом и возрастающие списки без повторов
+        if isinstance(first, slice) and first.step < 0:
+            start = 0 if first.stop is None else first.stop + 1
+            start += (first.start - start) % -first.step
+            U = np.asarray(self.U[(slice(start, first.start + 1, -first.step),) + rest])
+            return U[::-1]
+        if isinstance(first, np.ndarray):
+            unique, inverse = np.unique(first, return_inverse=True)
+            inverse = inverse.reshape(first.shape)
+            if all(isinstance(item, (int, np.integer, slice)) or item is Ellipsis for item in rest):
+                U = np.asarray(self.U[(unique,) + rest])
+                return U[inverse]
+            U = np.asarray(self.U[unique])
+            return U[(inverse,) + rest]
+        return np.asarray(self.U[(first,) + rest])
+
+    def __len__(self):
+        return self.n_snapshots
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
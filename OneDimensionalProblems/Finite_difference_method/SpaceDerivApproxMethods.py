@@ -1,9 +1,18 @@
+import functools
+
 import numpy as np
 
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
 """ Все функции имеют одинаковую сигнатуру
     Вход:
         U: np.array
-            Массив решения, от которого вычисляется пространственная производная
+            Массив решения, от которого вычисляется пространственная производная.
+            Может быть двумерным массивом (n_members, N) - набором решений,
+            тогда производная берётся вдоль последней оси.
         mesh: Mesh
             Равномерная сетка, на которой вычисляется решение
     Выход:
@@ -32,7 +41,7 @@ def get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef):
     """
     min_ind, max_ind = indexes
     assert (max_ind - min_ind + 1) == len(coefs_list)
-    N = U.shape[0]
+    N = U.shape[-1]
 
     # далее следует самый сложный кусок во всей программе
     # я не знаю, как сделать это более читаемым.
@@ -42,70 +51,286 @@ def get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef):
     for i, coef in enumerate(coefs_list):
         left_ind = start_ind + min_ind + i
         right_ind = finish_ind + min_ind + i 
-        dUdx[start_ind : finish_ind] += coef * U[left_ind : right_ind]
+        dUdx[..., start_ind : finish_ind] += coef * U[..., left_ind : right_ind]
 
     dUdx = dUdx / (dx_coef * mesh.dx)
     return dUdx
 
 
 
+# Параметры линейных шаблонов: (indexes, coefs_list, dx_coef),
+# см. get_linear_approximation_for_dUdx
+stencils_base = {
+    "Forward" : ((0, 1), [-1, 1], 1),
+    "Backward" : ((-1, 0), [-1, 1], 1),
+    "Upwind2" : ((-2, 0), [1, -4, 3], 2),
+    "Upwind3" : ((-2, 1), [1, -6, 3, 2], 6),
+    "Upwind5" : ((-3, 2), [-2, 15, -60, 20, 30, -3], 60),
+    "CD2" : ((-1, 1), [-1, 0, 1], 2),
+    "CD4" : ((-2, 2), [1, -8, 0, 8, -1], 12),
+    "CD6" : ((-3, 3), [-1, 9, -45, 0, 45, -9, 1], 60),
+}
+
+
 def forward(U, mesh):
     """ метод прямого переноса 1-го порядка """
-    indexes = (0, 1)
-    coefs_list = [-1, 1]
-    dx_coef = 1
+    indexes, coefs_list, dx_coef = stencils_base["Forward"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 def backward(U, mesh):
     """ метод прямого переноса 1-го порядка """
-    indexes = (-1, 0)
-    coefs_list = [-1, 1]
-    dx_coef = 1
+    indexes, coefs_list, dx_coef = stencils_base["Backward"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 def upwind2(U, mesh):
     """ Upwind 2-го порядка """
-    indexes = (-2, 0)
-    coefs_list = [1, -4, 3]
-    dx_coef = 2
+    indexes, coefs_list, dx_coef = stencils_base["Upwind2"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 def upwind3(U, mesh):
     """ Upwind 3-го порядка """
-    indexes = (-2, 1)
-    coefs_list = [1, -6, 3, 2]
-    dx_coef = 6
+    indexes, coefs_list, dx_coef = stencils_base["Upwind3"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 def upwind5(U, mesh):
     """ Upwind 5-го порядка """
-    indexes = (-3, 2)
-    coefs_list = [-2, 15, -60, 20, 30, -3]
-    dx_coef = 60
+    indexes, coefs_list, dx_coef = stencils_base["Upwind5"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 def central_diff2(U, mesh):
     """ Центральная разность 2-го порядка """
-    indexes = (-1, 1)
-    coefs_list = [-1, 0, 1]
-    dx_coef = 2
+    indexes, coefs_list, dx_coef = stencils_base["CD2"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 def central_diff4(U, mesh):
     """ Центральная разность 4-го порядка """
-    indexes = (-2, 2)
-    coefs_list = [1, 8, 0, 8, -1]
-    dx_coef = 12
+    indexes, coefs_list, dx_coef = stencils_base["CD4"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 def central_diff6(U, mesh):
     """ Центральная разность 6-го порядка """
-    indexes = (-3, 3)
-    coefs_list = [-1, 9, -45, 0, 45, -9, 1]
-    dx_coef = 60
+    indexes, coefs_list, dx_coef = stencils_base["CD6"]
     return get_linear_approximation_for_dUdx(U, mesh, indexes, coefs_list, dx_coef)
 
 
+def get_reconstruction_dUdx(U, mesh, interface_function, indexes):
+    """ Аппроксимация производной разностью значений на полуцелых узлах:
+            dU/dx (x_j) = (U_{j+1/2} - U_{j-1/2}) / dx,
+        где U_{j+1/2} восстанавливается по узлам слева от x_{j+1/2}
+        нелинейной процедурой (ограничители TVD, WENO). Такая производная
+        смещена против потока при положительной скорости.
+        В узлах, где шаблон не помещается, производная равна нулю.
+
+        Вход:
+            U: np.array
+                Массив решения
+            mesh: Mesh
+                Равномерная сетка
+            interface_function: function
+                Функция U -> значения U_{j+1/2} для всех j, где помещается её шаблон
+            indexes : tuple(int, int)
+                Смещения крайних узлов шаблона производной (как в stencils_base)
+
+        Выход:
+            dUdx: np.array
+                Массив пространственных производных в каждой точке сетки.
+    """
+    min_ind, max_ind = indexes
+    N = U.shape[-1]
+    dUdx = np.zeros_like(U)
+    interface_values = interface_function(U)
+    dUdx[..., -min_ind : N - max_ind] = np.diff(interface_values, axis=-1) / mesh.dx
+    return dUdx
+
+
+def minmod_slope(delta_minus, delta_plus):
+    """ Ограничитель minmod: меньший по модулю из наклонов одного знака """
+    return 0.5 * (np.sign(delta_minus) + np.sign(delta_plus)) * np.minimum(np.abs(delta_minus), np.abs(delta_plus))
+
+
+def vanleer_slope(delta_minus, delta_plus):
+    """ Ограничитель ван Лира: гармоническое среднее наклонов одного знака """
+    product = delta_minus * delta_plus
+    denominator = delta_minus + delta_plus
+    return np.where(product > 0, 2 * product / np.where(product > 0, denominator, 1.0), 0.0)
+
+
+def superbee_slope(delta_minus, delta_plus):
+    """ Ограничитель superbee: наибольший наклон, сохраняющий TVD """
+    abs_minus = np.abs(delta_minus)
+    abs_plus = np.abs(delta_plus)
+    slope = np.maximum(np.minimum(2 * abs_minus, abs_plus), np.minimum(abs_minus, 2 * abs_plus))
+    return np.where(delta_minus * delta_plus > 0, np.sign(delta_minus) * slope, 0.0)
+
+
+def muscl_interface_values(U, slope_limiter):
+    """ Значения U_{j+1/2} = U_j + slope_j / 2 (MUSCL) с ограниченным наклоном,
+        для j = 1 .. N-2
+    """
+    delta_minus = U[..., 1:-1] - U[..., :-2]
+    delta_plus = U[..., 2:] - U[..., 1:-1]
+    return U[..., 1:-1] + 0.5 * slope_limiter(delta_minus, delta_plus)
+
+
+# малый параметр в весах WENO, чтобы не делить на ноль на гладком решении
+weno_eps = 1e-6
+
+
+def weno5_interface_values(U):
+    """ Значения U_{j+1/2} по пяти узлам U_{j-2} .. U_{j+2} (WENO5, Jiang-Shu),
+        для j = 2 .. N-3
+    """
+    v0 = U[..., :-4]
+    v1 = U[..., 1:-3]
+    v2 = U[..., 2:-2]
+    v3 = U[..., 3:-1]
+    v4 = U[..., 4:]
+
+    # интерполяции 3-го порядка на трёх подшаблонах
+    q0 = (2*v0 - 7*v1 + 11*v2) / 6
+    q1 = (-v1 + 5*v2 + 2*v3) / 6
+    q2 = (2*v2 + 5*v3 - v4) / 6
+
+    # индикаторы гладкости
+    beta0 = 13/12 * (v0 - 2*v1 + v2)**2 + 1/4 * (v0 - 4*v1 + 3*v2)**2
+    beta1 = 13/12 * (v1 - 2*v2 + v3)**2 + 1/4 * (v1 - v3)**2
+    beta2 = 13/12 * (v2 - 2*v3 + v4)**2 + 1/4 * (3*v2 - 4*v3 + v4)**2
+
+    # нелинейные веса; на гладком решении они близки к линейным 1/10, 6/10, 3/10
+    alpha0 = 0.1 / (weno_eps + beta0)**2
+    alpha1 = 0.6 / (weno_eps + beta1)**2
+    alpha2 = 0.3 / (weno_eps + beta2)**2
+    return (alpha0 * q0 + alpha1 * q1 + alpha2 * q2) / (alpha0 + alpha1 + alpha2)
+
+
+def minmod_interface_values(U):
+    return muscl_interface_values(U, minmod_slope)
+
+def vanleer_interface_values(U):
+    return muscl_interface_values(U, vanleer_slope)
+
+def superbee_interface_values(U):
+    return muscl_interface_values(U, superbee_slope)
+
+
+# Нелинейные реконструкции: (interface_function, indexes),
+# см. get_reconstruction_dUdx
+reconstructions_base = {
+    "MUSCL-minmod" : (minmod_interface_values, (-2, 1)),
+    "MUSCL-vanLeer" : (vanleer_interface_values, (-2, 1)),
+    "MUSCL-superbee" : (superbee_interface_values, (-2, 1)),
+    "WENO5" : (weno5_interface_values, (-3, 2)),
+}
+
+
+def muscl_minmod(U, mesh):
+    """ MUSCL 2-го порядка с ограничителем minmod """
+    interface_function, indexes = reconstructions_base["MUSCL-minmod"]
+    return get_reconstruction_dUdx(U, mesh, interface_function, indexes)
+
+def muscl_vanleer(U, mesh):
+    """ MUSCL 2-го порядка с ограничителем ван Лира """
+    interface_function, indexes = reconstructions_base["MUSCL-vanLeer"]
+    return get_reconstruction_dUdx(U, mesh, interface_function, indexes)
+
+def muscl_superbee(U, mesh):
+    """ MUSCL 2-го порядка с ограничителем superbee """
+    interface_function, indexes = reconstructions_base["MUSCL-superbee"]
+    return get_reconstruction_dUdx(U, mesh, interface_function, indexes)
+
+def weno5(U, mesh):
+    """ WENO 5-го порядка """
+    interface_function, indexes = reconstructions_base["WENO5"]
+    return get_reconstruction_dUdx(U, mesh, interface_function, indexes)
+
+
+# Спектральные производные: параметры SpectralOperator
+spectral_methods_base = {
+    "Spectral" : dict(dealias=False, filter_order=None),
+    "Spectral-2/3" : dict(dealias=True, filter_order=None),
+    "Spectral-filter" : dict(dealias=False, filter_order=16),
+}
+
+# параметр экспоненциального фильтра: exp(-spectral_filter_alpha) - машинная точность
+spectral_filter_alpha = 36.0
+
+
+@functools.lru_cache(maxsize=32)
+def _get_spectral_multiplier(P, period, dealias, filter_order):
+    k = 2 * np.pi * np.fft.rfftfreq(P, d=period / P)
+    multiplier = 1j * k
+    if P % 2 == 0:
+        # для чётного P мода Найквиста не имеет производной
+        multiplier[-1] = 0
+    eta = np.arange(k.shape[0]) / (P // 2)
+    if dealias:
+        multiplier[eta > 2 / 3] = 0
+    if filter_order is not None:
+        multiplier *= np.exp(-spectral_filter_alpha * eta**filter_order)
+    multiplier.flags.writeable = False
+    return multiplier
+
+
+def get_spectral_multiplier(mesh, dealias=False, filter_order=None):
+    """ Множители i*k для спектральной производной на периодической сетке,
+        вычисляются один раз для сетки и сохраняются в кэше.
+
+        Вход:
+            mesh: Mesh
+                Равномерная сетка, последний узел которой совпадает с первым
+            dealias: bool
+                Обнулять моды выше 2/3 наибольшего волнового числа
+                (правило 2/3 для нелинейных задач)
+            filter_order: int
+                Порядок экспоненциального фильтра exp(-alpha * (k / k_max)**filter_order);
+                None - без фильтра
+
+        Выход:
+            multiplier: np.array[complex]
+                Массив длины (N - 1) // 2 + 1, только для чтения
+    """
+    if not getattr(mesh, 'uniform', True):
+        raise ValueError("Спектральная производная реализована только для равномерной сетки")
+    return _get_spectral_multiplier(mesh.N - 1, float(mesh.xright - mesh.xleft), dealias, filter_order)
+
+
+def get_spectral_dUdx(U, mesh, dealias=False, filter_order=None):
+    """ Спектральная производная периодического решения через БПФ.
+        Последний узел сетки совпадает с первым, период равен xright - xleft.
+
+        Вход:
+            U: np.array
+                Массив решения
+            mesh: Mesh
+                Равномерная сетка
+            dealias, filter_order:
+                См. get_spectral_multiplier
+
+        Выход:
+            dUdx: np.array
+                Массив пространственных производных в каждой точке сетки.
+    """
+    P = U.shape[-1] - 1
+    multiplier = get_spectral_multiplier(mesh, dealias, filter_order)
+    dUdx = np.empty_like(U)
+    dUdx[..., :P] = np.fft.irfft(np.fft.rfft(U[..., :P]) * multiplier, n=P)
+    dUdx[..., P] = dUdx[..., 0]
+    return dUdx
+
+
+def spectral(U, mesh):
+    """ Спектральная производная (периодическая задача) """
+    return get_spectral_dUdx(U, mesh, **spectral_methods_base["Spectral"])
+
+def spectral_dealiased(U, mesh):
+    """ Спектральная производная с правилом 2/3 (периодическая задача) """
+    return get_spectral_dUdx(U, mesh, **spectral_methods_base["Spectral-2/3"])
+
+def spectral_filtered(U, mesh):
+    """ Спектральная производная с экспоненциальным фильтром (периодическая задача) """
+    return get_spectral_dUdx(U, mesh, **spectral_methods_base["Spectral-filter"])
+
+
 dUdx_function_base = {
     "Forward" : forward,
     "Backward" : backward,
@@ -115,9 +340,27 @@ dUdx_function_base = {
     "CD2" : central_diff2,
     "CD4" : central_diff4,
     "CD6" : central_diff6,
+    "MUSCL-minmod" : muscl_minmod,
+    "MUSCL-vanLeer" : muscl_vanleer,
+    "MUSCL-superbee" : muscl_superbee,
+    "WENO5" : weno5,
+    "Spectral" : spectral,
+    "Spectral-2/3" : spectral_dealiased,
+    "Spectral-filter" : spectral_filtered,
 }
 
 
+def get_stencil_indexes(space_deriv_approx_method):
+    """ Смещения крайних узлов шаблона (min_ind, max_ind) для любого метода
+        из dUdx_function_base, кроме спектральных (их шаблон - вся сетка)
+    """
+    if space_deriv_approx_method in spectral_methods_base:
+        raise ValueError("Спектральная производная использует все узлы сетки")
+    if space_deriv_approx_method in reconstructions_base:
+        return reconstructions_base[space_deriv_approx_method][1]
+    return stencils_base[space_deriv_approx_method][0]
+
+
 def generate_dUdx_function(space_deriv_approx_method):
     """ Возвращает функцию, которая по текущему решению и сетке
         возвращает аппроксимацию пространственной производной.
@@ -133,4 +376,480 @@ def generate_dUdx_function(space_deriv_approx_method):
                     - U (вектор значений в узлах)
                     - mesh - сетка, на которой вычисляется решение
     """
-    return dUdx_function_base[space_deriv_approx_method]
\ No newline at end of file
+    return dUdx_function_base[space_deriv_approx_method]
+
+
+def fornberg_weights(x0, x, m=1):
+    """ Веса конечно-разностной аппроксимации производной порядка m
+        в точке x0 по значениям в узлах x (алгоритм Форнберга).
+
+        Все операции поэлементные, поэтому веса можно вычислить сразу
+        для многих точек: x0 формы (K,) и x формы (n, K).
+
+        Вход:
+            x0: float или np.array
+                Точка, в которой аппроксимируется производная
+            x: np.array
+                Узлы шаблона (не обязательно равномерные), первая ось - номер узла
+            m: int
+                Порядок производной
+
+        Выход:
+            weights: np.array
+                Веса, с которыми нужно сложить значения в узлах x (форма как у x)
+    """
+    x0 = np.asarray(x0, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[0]
+    c = np.zeros((n, m + 1) + np.broadcast_shapes(x0.shape, x.shape[1:]))
+    c[0, 0] = 1.0
+    c1 = 1.0
+    c4 = x[0] - x0
+    for i in range(1, n):
+        mn = min(i, m)
+        c2 = 1.0
+        c5 = c4
+        c4 = x[i] - x0
+        for j in range(i):
+            c3 = x[i] - x[j]
+            c2 *= c3
+            if j == i - 1:
+                for k in range(mn, 0, -1):
+                    c[i, k] = c1 * (k * c[i-1, k-1] - c5 * c[i-1, k]) / c2
+                c[i, 0] = -c1 * c5 * c[i-1, 0] / c2
+            for k in range(mn, 0, -1):
+                c[j, k] = (c4 * c[j, k] - k * c[j, k-1]) / c3
+            c[j, 0] = c4 * c[j, 0] / c3
+        c1 = c2
+    return c[:, m]
+
+
+class StencilOperator:
+    """ Линейный оператор пространственной производной на равномерной сетке.
+
+        Создаётся один раз для сетки: коэффициенты шаблона сразу делятся
+        на dx_coef * dx, а результат записывается в массив, переданный
+        вызывающим кодом. Узлы, в которые шаблон не помещается, обрабатываются
+        одним из граничных замыканий:
+            "zero" - производная в них равна нулю (как в get_linear_approximation_for_dUdx)
+            "one-sided" - односторонний шаблон той же ширины, сдвинутый внутрь области
+            "periodic" - периодическое продолжение; последний узел сетки
+                         совпадает с первым (xright отождествляется с xleft)
+        Сумма по шаблону накапливается в типе массива out, поэтому решение
+        во float32 с результатом во float64 дифференцируется без лишних округлений.
+    """
+
+    boundaries = ("zero", "one-sided", "periodic")
+
+    def __init__(self, indexes, coefs_list, dx_coef, mesh, boundary="zero"):
+        """
+        Вход:
+            indexes, coefs_list, dx_coef:
+                Описание шаблона, как в get_linear_approximation_for_dUdx
+            mesh: Mesh
+                Равномерная сетка
+            boundary: str
+                Граничное замыкание: "zero", "one-sided" или "periodic"
+        """
+        if boundary not in self.boundaries:
+            raise ValueError(f"Неизвестное граничное замыкание: {boundary}")
+        min_ind, max_ind = indexes
+        assert (max_ind - min_ind + 1) == len(coefs_list)
+
+        self.indexes = indexes
+        self.boundary = boundary
+        self.N = mesh.N
+        self.dx = mesh.dx
+
+        weights = np.asarray(coefs_list, dtype=np.float64) / (dx_coef * mesh.dx)
+        offsets = np.arange(min_ind, max_ind + 1)
+        nonzero = np.flatnonzero(weights)
+        self.offsets = offsets[nonzero]
+        self.weights = weights[nonzero]
+
+        # число узлов слева и справа, в которые шаблон не помещается
+        self.n_left = -min(min_ind, 0)
+        self.n_right = max(max_ind, 0)
+
+        # односторонние замыкания: в j-м граничном узле используется шаблон
+        # на первых (последних) width узлах сетки
+        width = max_ind - min_ind + 1
+        self.width = width
+        nodes = np.arange(width)
+        self.left_closure = np.array([fornberg_weights(j, nodes) for j in range(self.n_left)]).reshape(-1, width)
+        self.right_closure = np.array([fornberg_weights(width - self.n_right + j, nodes)
+                                       for j in range(self.n_right)]).reshape(-1, width)
+        self.left_closure /= mesh.dx
+        self.right_closure /= mesh.dx
+
+        self._tmp = None
+
+    def _get_tmp(self, U):
+        """ Рабочий массив формы и типа U; переиспользуется между вызовами """
+        tmp = self._tmp
+        if (tmp is None or tmp.dtype != U.dtype or tmp.shape[:-1] != U.shape[:-1]
+                or tmp.shape[-1] < U.shape[-1]):
+            tmp = np.empty(U.shape, dtype=U.dtype)
+            self._tmp = tmp
+        return tmp[..., :U.shape[-1]]
+
+    def __call__(self, U, out=None):
+        """ Вычисление производной.
+
+            Вход:
+                U: np.array
+                    Массив решения (N,) или (n_members, N)
+                out: np.array
+                    Массив для результата; создаётся, если не задан
+
+            Выход:
+                dUdx: np.array
+                    Массив пространственных производных (out)
+        """
+        if out is None:
+            out = np.empty_like(U)
+        if self.boundary == "periodic":
+            return self._apply_periodic(U, out)
+
+        N = U.shape[-1]
+        start_ind, finish_ind = self.n_left, N - self.n_right
+        tmp = self._get_tmp(out)
+        interior = out[..., start_ind:finish_ind]
+        tmp_interior = tmp[..., start_ind:finish_ind]
+        for i, (offset, weight) in enumerate(zip(self.offsets, self.weights)):
+            shifted = U[..., start_ind + offset : finish_ind + offset]
+            if i == 0:
+                np.multiply(shifted, weight, out=interior)
+            else:
+                np.multiply(shifted, weight, out=tmp_interior)
+                interior += tmp_interior
+
+        if self.boundary == "zero":
+            out[..., :start_ind] = 0
+            out[..., finish_ind:] = 0
+        else:
+            width = self.width
+            if self.n_left:
+                out[..., :start_ind] = U[..., :width] @ self.left_closure.T
+            if self.n_right:
+                out[..., finish_ind:] = U[..., N - width:] @ self.right_closure.T
+        return out
+
+    def _apply_periodic(self, U, out):
+        P = U.shape[-1] - 1   # число различных узлов
+        tmp = self._get_tmp(out)
+        for i, (offset, weight) in enumerate(zip(self.offsets, self.weights)):
+            # out[j] += weight * U[(j + offset) mod P]
+            shift = offset % P
+            target = out if i == 0 else tmp
+            np.multiply(U[..., shift:P], weight, out=target[..., :P - shift])
+            np.multiply(U[..., :shift], weight, out=target[..., P - shift:P])
+            if i > 0:
+                out[..., :P] += tmp[..., :P]
+        out[..., P] = out[..., 0]
+        return out
+
+    def to_sparse(self, N=None):
+        """ Оператор в виде разреженной матрицы scipy.sparse (формат CSR),
+            например для неявных схем.
+
+            Вход:
+                N: int
+                    Размер матрицы; по умолчанию - число узлов сетки
+
+            Выход:
+                D: scipy.sparse.csr_matrix
+                    Матрица (N, N), такая что D @ U совпадает с self(U)
+        """
+        if scipy is None:
+            raise ImportError("Для построения разреженной матрицы нужен пакет scipy")
+        N = self.N if N is None else N
+        rows, cols, vals = [], [], []
+        if self.boundary == "periodic":
+            P = N - 1
+            for offset, weight in zip(self.offsets, self.weights):
+                j = np.arange(P)
+                rows.append(j)
+                cols.append((j + offset) % P)
+                vals.append(np.full(P, weight))
+            # последний узел повторяет первый
+            rows.append(np.full(len(self.offsets), P))
+            cols.append(self.offsets % P)
+            vals.append(self.weights)
+        else:
+            j = np.arange(self.n_left, N - self.n_right)
+            for offset, weight in zip(self.offsets, self.weights):
+                rows.append(j)
+                cols.append(j + offset)
+                vals.append(np.full(j.shape[0], weight))
+            if self.boundary == "one-sided":
+                nodes = np.arange(self.width)
+                for j, closure in enumerate(self.left_closure):
+                    rows.append(np.full(self.width, j))
+                    cols.append(nodes)
+                    vals.append(closure)
+                for j, closure in enumerate(self.right_closure):
+                    rows.append(np.full(self.width, N - self.n_right + j))
+                    cols.append(N - self.width + nodes)
+                    vals.append(closure)
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        vals = np.concatenate(vals)
+        return scipy.sparse.csr_matrix((vals, (rows, cols)), shape=(N, N))
+
+
+class NonuniformStencilOperator:
+    """ Оператор пространственной производной на неравномерной сетке.
+
+        Шаблон задаётся только набором смещений indexes: в каждом узле
+        веса строятся по фактическим координатам узлов шаблона алгоритмом
+        Форнберга (fornberg_weights) один раз при создании оператора.
+        На равномерной сетке веса совпадают с коэффициентами шаблонов
+        stencils_base. Граничные замыкания - как в StencilOperator;
+        для "periodic" последний узел совпадает с первым,
+        а период равен xright - xleft.
+    """
+
+    boundaries = StencilOperator.boundaries
+
+    def __init__(self, indexes, mesh, boundary="zero"):
+        """
+        Вход:
+            indexes: tuple(int, int)
+                Смещения крайних узлов шаблона, как в get_linear_approximation_for_dUdx
+            mesh: NonuniformMesh
+                Сетка
+            boundary: str
+                Граничное замыкание: "zero", "one-sided" или "periodic"
+        """
+        if boundary not in self.boundaries:
+            raise ValueError(f"Неизвестное граничное замыкание: {boundary}")
+        min_ind, max_ind = indexes
+        self.indexes = indexes
+        self.boundary = boundary
+        self.N = N = mesh.N
+        self.offsets = np.arange(min_ind, max_ind + 1)
+        self.width = width = self.offsets.shape[0]
+        self.n_left = -min(min_ind, 0)
+        self.n_right = max(max_ind, 0)
+
+        x = mesh.xnodes
+        nodes = np.arange(N)
+        if boundary == "periodic":
+            P = N - 1
+            self.interior = (self.n_left, P - self.n_right)
+            # последний узел повторяет первый
+            centers = np.where(nodes < P, nodes, 0)
+            shifted = centers[:, np.newaxis] + self.offsets
+            self.columns = shifted % P
+            positions = x[self.columns] + (shifted // P) * (x[P] - x[0])
+        else:
+            self.interior = (self.n_left, N - self.n_right)
+            centers = nodes
+            # в граничных узлах шаблон сдвигается внутрь области
+            starts = np.clip(nodes + min_ind, 0, N - width)
+            self.columns = starts[:, np.newaxis] + np.arange(width)
+            positions = x[self.columns]
+        self.weights = fornberg_weights(x[centers], positions.T).T
+
+        start_ind, finish_ind = self.interior
+        self.boundary_rows = np.concatenate([nodes[:start_ind], nodes[max(finish_ind, start_ind):]])
+        if boundary == "zero":
+            self.weights[self.boundary_rows] = 0
+
+    def __call__(self, U, out=None):
+        """ Вычисление производной (см. StencilOperator.__call__) """
+        if U.shape[-1] != self.N:
+            raise ValueError("Оператор на неравномерной сетке применим только ко всей сетке")
+        if out is None:
+            out = np.empty_like(U)
+        start_ind, finish_ind = self.interior
+        interior = out[..., start_ind:finish_ind]
+        for q, offset in enumerate(self.offsets):
+            term = U[..., start_ind + offset : finish_ind + offset] * self.weights[start_ind:finish_ind, q]
+            if q == 0:
+                interior[...] = term
+            else:
+                interior += term
+        rows = self.boundary_rows
+        out[..., rows] = np.sum(U[..., self.columns[rows]] * self.weights[rows], axis=-1)
+        return out
+
+    def to_sparse(self, N=None):
+        """ Оператор в виде разреженной матрицы scipy.sparse (формат CSR) """
+        if scipy is None:
+            raise ImportError("Для построения разреженной матрицы нужен пакет scipy")
+        if N is not None and N != self.N:
+            raise ValueError("Размер матрицы должен совпадать с числом узлов сетки")
+        rows = np.repeat(np.arange(self.N), self.width)
+        return scipy.sparse.csr_matrix((self.weights.ravel(), (rows, self.columns.ravel())),
+                                       shape=(self.N, self.N))
+
+
+class ReconstructionOperator:
+    """ Нелинейный оператор пространственной производной (TVD, WENO)
+        с интерфейсом StencilOperator.
+
+        Граничные замыкания:
+            "zero" - производная равна нулю в узлах, где шаблон не помещается
+            "one-sided" - решение продолжается за границу постоянным значением
+            "periodic" - периодическое продолжение, последний узел совпадает с первым
+        Отражённый оператор (mirrored) - та же реконструкция справа налево,
+        то есть смещённая против потока при отрицательной скорости.
+    """
+
+    boundaries = StencilOperator.boundaries
+
+    def __init__(self, space_deriv_approx_method, mesh, boundary="zero", mirrored=False):
+        """
+        Вход:
+            space_deriv_approx_method: str
+                Ключ reconstructions_base
+            mesh: Mesh
+                Равномерная сетка
+            boundary: str
+                Граничное замыкание: "zero", "one-sided" или "periodic"
+            mirrored: bool
+                Использовать зеркально отражённую реконструкцию
+        """
+        if boundary not in self.boundaries:
+            raise ValueError(f"Неизвестное граничное замыкание: {boundary}")
+        if not getattr(mesh, 'uniform', True):
+            raise ValueError("Нелинейные реконструкции реализованы только для равномерной сетки")
+        self.interface_function, self.indexes = reconstructions_base[space_deriv_approx_method]
+        self.boundary = boundary
+        self.mirrored = mirrored
+        self.mesh = mesh
+        min_ind, max_ind = self.indexes
+        self.n_left = -min_ind
+        self.n_right = max_ind
+
+    def __call__(self, U, out=None):
+        """ Вычисление производной (см. StencilOperator.__call__) """
+        if out is None:
+            out = np.empty_like(U)
+        # реконструкция всегда во float64, даже если решение хранится во float32
+        U = np.asarray(U, dtype=np.float64)
+        if self.mirrored:
+            # D'(U)(x) = -D(U(-x))(-x)
+            self._apply(U[..., ::-1], out[..., ::-1])
+            np.negative(out, out=out)
+        else:
+            self._apply(U, out)
+        return out
+
+    def _apply(self, U, out):
+        n_left, n_right = self.n_left, self.n_right
+        if self.boundary == "zero":
+            out[...] = get_reconstruction_dUdx(U, self.mesh, self.interface_function, self.indexes)
+            return
+        if self.boundary == "periodic":
+            P = U.shape[-1] - 1
+            padded = np.concatenate([U[..., P - n_left:P], U[..., :P], U[..., :n_right]], axis=-1)
+        else:
+            padded = np.concatenate([np.repeat(U[..., :1], n_left, axis=-1), U,
+                                     np.repeat(U[..., -1:], n_right, axis=-1)], axis=-1)
+        dUdx = get_reconstruction_dUdx(padded, self.mesh, self.interface_function, self.indexes)
+        interior = dUdx[..., n_left:padded.shape[-1] - n_right]
+        out[..., :interior.shape[-1]] = interior
+        if self.boundary == "periodic":
+            out[..., -1] = out[..., 0]
+
+    def to_sparse(self, N=None):
+        raise ValueError("Нелинейный оператор нельзя представить матрицей")
+
+
+class SpectralOperator:
+    """ Спектральный оператор пространственной производной
+        с интерфейсом StencilOperator. Только для периодической границы.
+    """
+
+    def __init__(self, space_deriv_approx_method, mesh, boundary="periodic"):
+        """
+        Вход:
+            space_deriv_approx_method: str
+                Ключ spectral_methods_base
+            mesh: Mesh
+                Равномерная сетка, последний узел которой совпадает с первым
+            boundary: str
+                Должно быть "periodic"
+        """
+        if boundary != "periodic":
+            raise ValueError("Спектральная производная возможна только с периодической границей")
+        self.boundary = boundary
+        self.mesh = mesh
+        self.params = spectral_methods_base[space_deriv_approx_method]
+        self.multiplier = get_spectral_multiplier(mesh, **self.params)
+
+    def __call__(self, U, out=None):
+        """ Вычисление производной (см. StencilOperator.__call__) """
+        if out is None:
+            out = np.empty_like(U)
+        P = U.shape[-1] - 1
+        # БПФ во float64: от float32 np.fft.rfft вернул бы complex64
+        U_periodic = np.asarray(U[..., :P], dtype=np.float64)
+        out[..., :P] = np.fft.irfft(np.fft.rfft(U_periodic) * self.multiplier, n=P)
+        out[..., P] = out[..., 0]
+        return out
+
+    def to_sparse(self, N=None):
+        raise ValueError("Спектральный оператор задаётся плотной матрицей")
+
+
+def get_mirrored_stencil(space_deriv_approx_method):
+    """ Зеркальное отражение шаблона: смещения меняют знак, коэффициенты
+        переставляются в обратном порядке и меняют знак.
+        Например, "Backward" отражается в "Forward". Для смещённых против
+        потока шаблонов это шаблон для отрицательной скорости.
+
+        Вход:
+            space_deriv_approx_method: str
+                Название метода аппроксимации пространственной производной
+
+        Выход:
+            indexes, coefs_list, dx_coef:
+                Описание отражённого шаблона, как в stencils_base
+    """
+    (min_ind, max_ind), coefs_list, dx_coef = stencils_base[space_deriv_approx_method]
+    return (-max_ind, -min_ind), [-coef for coef in reversed(coefs_list)], dx_coef
+
+
+def is_symmetric_stencil(space_deriv_approx_method):
+    """ Совпадает ли шаблон со своим зеркальным отражением (центральные разности) """
+    if space_deriv_approx_method in spectral_methods_base:
+        return True
+    if space_deriv_approx_method in reconstructions_base:
+        return False
+    indexes, coefs_list, dx_coef = stencils_base[space_deriv_approx_method]
+    return get_mirrored_stencil(space_deriv_approx_method) == (indexes, list(coefs_list), dx_coef)
+
+
+def generate_dUdx_operator(space_deriv_approx_method, mesh, boundary="zero", mirrored=False):
+    """ Создаёт оператор пространственной производной для данной сетки.
+
+        Вход:
+            space_deriv_approx_method: str
+                Название метода аппроксимации пространственной производной
+            mesh: Mesh
+                Сетка, на которой вычисляется решение
+            boundary: str
+                Граничное замыкание: "zero", "one-sided" или "periodic"
+            mirrored: bool
+                Использовать зеркально отражённый шаблон (см. get_mirrored_stencil)
+
+        Выход:
+            dUdx_operator: StencilOperator, NonuniformStencilOperator, ReconstructionOperator
+                или SpectralOperator
+                Вызываемый объект: dUdx_operator(U, out=None)
+    """
+    if space_deriv_approx_method in spectral_methods_base:
+        return SpectralOperator(space_deriv_approx_method, mesh, boundary)
+    if space_deriv_approx_method in reconstructions_base:
+        return ReconstructionOperator(space_deriv_approx_method, mesh, boundary, mirrored)
+    if mirrored:
+        indexes, coefs_list, dx_coef = get_mirrored_stencil(space_deriv_approx_method)
+    else:
+        indexes, coefs_list, dx_coef = stencils_base[space_deriv_approx_method]
+    if not getattr(mesh, 'uniform', True):
+        return NonuniformStencilOperator(indexes, mesh, boundary)
+    return StencilOperator(indexes, coefs_list, dx_coef, mesh, boundary)
@@ -0,0 +1,8 @@
+""" Замеры производительности численных методов.
+
+    Запуск из каталога Finite_difference_method:
+        python -m benchmarks --sizes 3001 30001 --out results.json
+        python -m benchmarks --baseline results.json
+        python -m benchmarks.scaling --N 10000001 --workers 1 2 4 8 16 32
+        python -m benchmarks.precision --N 3001 --steps 2000
+"""
@@ -0,0 +1,35 @@
+""" Запуск замеров из командной строки (см. benchmarks/__init__.py) """
+
+from benchmarks import throughput
+
+import argparse
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности методов Рунге-Кутты и шаблонов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3001, 30001, 1000001])
+    parser.add_argument("--steps", type=int, default=20, help="число шагов по времени в замере")
+    parser.add_argument("--repeats", type=int, default=5, help="число повторов замера времени (берётся лучший)")
+    parser.add_argument("--time-methods", nargs="+", default=None)
+    parser.add_argument("--space-methods", nargs="+", default=None)
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "numba", "auto"])
+    parser.add_argument("--out", default=None, help="файл результатов (.json или .csv)")
+    parser.add_argument("--baseline", default=None, help="JSON базового замера для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = throughput.run_all(args.sizes, args.time_methods, args.space_methods,
+                                 n_steps=args.steps, repeats=args.repeats, backend=args.backend, out=args.out)
+
+    if args.baseline is not None:
+        regressions = throughput.compare_with_baseline(results, throughput.load_results(args.baseline),
+                                                       args.tolerance)
+        for regression in regressions:
+            print("РЕГРЕССИЯ:", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+""" Расчёт с хранением решения во float32 (precision="float32" в utils.main_runner)
+    против того же расчёта во float64: отличие решений, время и пиковая память.
+
+    Оценка отличия. Во float32 суммы стадий и производная по пространству
+    накапливаются в float64, поэтому за шаг решение и слои k округляются
+    до float32 по одному разу, с относительной ошибкой не больше
+    u = 2**-24. Для устойчивой схемы (возмущения не растут) ошибки шагов
+    складываются не более чем линейно:
+        max|U_float32 - U_float64| <= n_steps * u * max|U_float64|,
+    а на практике растут как sqrt(n_steps) * u. Для неустойчивых сочетаний
+    (например, Euler-1 + CD2) оценка неверна: ошибки округления усиливаются
+    вместе с решением. С адаптивным шагом (rtol, atol) последовательность
+    шагов во float32 может отличаться: шум округления порядка u * max|U|
+    на масштабе сетки растёт при шагах у границы устойчивости, и оценка
+    локальной ошибки его замечает. Тогда решения различаются на величину
+    ошибки аппроксимации по времени, а не округления.
+
+    Запуск из каталога Finite_difference_method:
+        python -m benchmarks.precision --N 3001 --steps 2000 --out precision.json
+    Код возврата 1, если хотя бы одно сочетание нарушает оценку.
+"""
+
+from benchmarks import throughput
+
+import utils
+import models
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+# относительная ошибка округления до float32
+UNIT_ROUNDOFF = 2.0 ** -24
+
+
+def get_error_bound(n_steps, U_reference):
+    """ Оценка сверху отличия решения во float32 от решения во float64
+        после n_steps шагов (см. описание модуля)
+    """
+    return n_steps * UNIT_ROUNDOFF * float(np.max(np.abs(U_reference)))
+
+
+def run_case(time_step_method, space_deriv_approx_method, N, n_steps=2000, Cu=0.5, memory_steps=2, **runner_kw):
+    """ Сравнение расчётов во float64 и float32 для одного сочетания методов.
+
+        Вход:
+            time_step_method, space_deriv_approx_method: str
+                Методы по времени и пространству
+            N: int
+                Число узлов сетки
+            n_steps: int
+                Число шагов по времени
+            Cu: float
+                Число Куранта
+            memory_steps: int
+                Число шагов короткого расчёта, в котором tracemalloc
+                измеряет пиковую память
+            runner_kw:
+                Дополнительные аргументы utils.main_runner (например, backend)
+
+        Выход:
+            result: dict
+                'max_abs_diff' - max|U_float32 - U_float64|,
+                'error_bound' - оценка get_error_bound, 'within_bound',
+                'wall_seconds_float64', 'wall_seconds_float32', 'speed_ratio',
+                'peak_memory_bytes_float64', 'peak_memory_bytes_float32', 'memory_ratio'
+                (отношения - float32 к float64)
+    """
+    mesh = models.Mesh(throughput.XLEFT, throughput.XRIGHT, N)
+    task_params = models.TaskParams(throughput.halfsinus, throughput.uniform_speed, throughput.zero_rightfunc)
+    total_time = n_steps * mesh.dx * Cu
+
+    result = {
+        "time_step_method" : time_step_method,
+        "space_deriv_approx_method" : space_deriv_approx_method,
+        "N" : N,
+    }
+    solutions = {}
+    for precision in ("float64", "float32"):
+        tracemalloc.start()
+        utils.main_runner(task_params, mesh, Cu, memory_steps * mesh.dx * Cu, time_step_method,
+                          space_deriv_approx_method, memory_steps, show_progress=False,
+                          precision=precision, **runner_kw)
+        result["peak_memory_bytes_" + precision] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        wall_start = time.perf_counter()
+        U, time_steps = utils.main_runner(task_params, mesh, Cu, total_time, time_step_method,
+                                          space_deriv_approx_method, 10 * n_steps, show_progress=False,
+                                          precision=precision, **runner_kw)
+        result["wall_seconds_" + precision] = time.perf_counter() - wall_start
+        solutions[precision] = U
+
+    U_reference = solutions["float64"]
+    result["n_steps"] = len(time_steps)
+    result["max_abs_diff"] = float(np.max(np.abs(solutions["float32"].astype(np.float64) - U_reference)))
+    result["error_bound"] = get_error_bound(len(time_steps), U_reference)
+    result["within_bound"] = result["max_abs_diff"] <= result["error_bound"]
+    result["speed_ratio"] = result["wall_seconds_float64"] / result["wall_seconds_float32"]
+    result["memory_ratio"] = result["peak_memory_bytes_float32"] / result["peak_memory_bytes_float64"]
+    return result
+
+
+def run_all(N=3001, time_step_methods=("Hoin", "RK-6", "RK-7", "SSP-RK3", "DP-54"),
+            space_deriv_approx_methods=("Upwind3", "Upwind5", "CD4", "CD6", "WENO5"), verbose=True, **case_kw):
+    """ Сравнение для всех сочетаний методов (по умолчанию - устойчивых при Cu = 0.5).
+
+        Выход:
+            results: list[dict]
+                Результаты run_case
+    """
+    results = []
+    for time_step_method in time_step_methods:
+        for space_deriv_approx_method in space_deriv_approx_methods:
+            result = run_case(time_step_method, space_deriv_approx_method, N, **case_kw)
+            results.append(result)
+            if verbose:
+                print(f"{time_step_method:>8} + {space_deriv_approx_method:<8} N={N:<8} "
+                      f"diff={result['max_abs_diff']:.2e} <= {result['error_bound']:.2e}: "
+                      f"{'да' if result['within_bound'] else 'НЕТ'}  "
+                      f"ускорение x{result['speed_ratio']:.2f}  память x{result['memory_ratio']:.2f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Точность, время и память расчёта во float32 против float64")
+    parser.add_argument("--N", type=int, default=3001)
+    parser.add_argument("--steps", type=int, default=2000, help="число шагов по времени")
+    parser.add_argument("--time-methods", nargs="+", default=["Hoin", "RK-6", "RK-7", "SSP-RK3", "DP-54"])
+    parser.add_argument("--space-methods", nargs="+", default=["Upwind3", "Upwind5", "CD4", "CD6", "WENO5"])
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "numba", "auto"])
+    parser.add_argument("--out", default=None, help="файл результатов (.json или .csv)")
+    args = parser.parse_args(argv)
+
+    results = run_all(args.N, args.time_methods, args.space_methods, n_steps=args.steps, backend=args.backend)
+    if args.out is not None:
+        throughput.save_results(results, args.out)
+    return 0 if all(result["within_bound"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
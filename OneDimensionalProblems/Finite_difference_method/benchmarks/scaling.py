@@ -0,0 +1,95 @@
+""" Сильная масштабируемость расчёта с разбиением на подобласти
+    (DomainDecomposition.decomposed_runner): одна и та же задача
+    на 1, 2, 4, ... процессах.
+
+    Запуск из каталога Finite_difference_method:
+        python -m benchmarks.scaling --N 10000001 --workers 1 2 4 8 16 32 --out scaling.json
+"""
+
+from benchmarks import throughput
+
+import models
+import DomainDecomposition
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+
+def run_scaling(N=10000001, workers=(1, 2, 4, 8, 16, 32), n_steps=10, time_step_method="RK-6",
+                space_deriv_approx_method="CD6", Cu=0.5, verbose=True):
+    """ Замер времени одного и того же расчёта на разном числе процессов.
+
+        Вход:
+            N: int
+                Число узлов сетки
+            workers: list[int]
+                Числа процессов
+            n_steps: int
+                Число шагов по времени
+            time_step_method, space_deriv_approx_method: str
+                Методы по времени и пространству
+            Cu: float
+                Число Куранта
+            verbose: bool
+                Печатать ли результаты по мере получения
+
+        Выход:
+            results: list[dict]
+                'n_workers', 'wall_seconds', 'node_updates_per_sec',
+                'speedup' - ускорение относительно первого числа процессов
+                (пересчитанное на один процесс), 'efficiency' - speedup / n_workers,
+                'cpu_count' - число ядер машины: при n_workers > cpu_count
+                процессы делят ядра и ускорения не будет
+    """
+    mesh = models.Mesh(throughput.XLEFT, throughput.XRIGHT, N)
+    task_params = models.TaskParams(throughput.halfsinus, throughput.uniform_speed, throughput.zero_rightfunc)
+    total_time = n_steps * mesh.dx * Cu
+    cpu_count = multiprocessing.cpu_count()
+
+    results = []
+    for n_workers in workers:
+        wall_start = time.perf_counter()
+        U, time_steps = DomainDecomposition.decomposed_runner(task_params, mesh, Cu, total_time, time_step_method,
+                                                              space_deriv_approx_method, 10 * n_steps,
+                                                              n_workers=n_workers)
+        wall_seconds = time.perf_counter() - wall_start
+        result = {
+            "time_step_method" : time_step_method,
+            "space_deriv_approx_method" : space_deriv_approx_method,
+            "N" : N,
+            "n_steps" : len(time_steps),
+            "n_workers" : n_workers,
+            "cpu_count" : cpu_count,
+            "wall_seconds" : wall_seconds,
+            "node_updates_per_sec" : N * len(time_steps) / wall_seconds,
+        }
+        base = results[0] if results else result
+        result["speedup"] = base["wall_seconds"] * base["n_workers"] / wall_seconds
+        result["efficiency"] = result["speedup"] / n_workers
+        results.append(result)
+        if verbose:
+            print(f"{n_workers:3d} процессов: {wall_seconds:8.3f} с, ускорение {result['speedup']:6.2f},"
+                  f" эффективность {result['efficiency']:5.2f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сильная масштабируемость расчёта с разбиением на подобласти")
+    parser.add_argument("--N", type=int, default=10000001)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--steps", type=int, default=10, help="число шагов по времени в замере")
+    parser.add_argument("--time-method", default="RK-6")
+    parser.add_argument("--space-method", default="CD6")
+    parser.add_argument("--out", default=None, help="файл результатов (.json или .csv)")
+    args = parser.parse_args(argv)
+
+    results = run_scaling(args.N, args.workers, args.steps, args.time_method, args.space_method)
+    if args.out is not None:
+        throughput.save_results(results, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
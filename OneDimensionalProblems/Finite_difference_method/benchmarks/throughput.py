@@ -0,0 +1,226 @@
+""" Пропускная способность и точность всех сочетаний
+    метод Рунге-Кутты x шаблон пространственной производной.
+"""
+
+import utils
+import models
+import PreciseSolutions
+import RungeCuttaMethods
+import SpaceDerivApproxMethods
+
+import csv
+import json
+import time
+import platform
+import tracemalloc
+
+import numpy as np
+
+
+XLEFT = 0
+XRIGHT = 3000
+SPEED = 1
+
+
+@models.vectorized
+def halfsinus(x):
+    """ Гладкий импульс из main_runner.ipynb """
+    m = 5
+    inside = (x >= 1480) & (x <= 1520)
+    return np.where(inside, np.sin(((x - 1480) * np.pi) / 40) ** m, 0.0)
+
+
+def uniform_speed(mesh, U):
+    return np.ones_like(mesh.xnodes) * SPEED
+
+
+def zero_rightfunc(mesh, t, U):
+    return np.zeros_like(mesh.xnodes)
+
+
+def run_case(time_step_method, space_deriv_approx_method, N, n_steps=20, Cu=0.5, memory_steps=2, repeats=5,
+             **runner_kw):
+    """ Замер одного сочетания методов на сетке из N узлов.
+
+        Вход:
+            time_step_method: str
+                Ключ RungeCuttaMethods.runge_cutta_funcions_base
+            space_deriv_approx_method: str
+                Ключ SpaceDerivApproxMethods.dUdx_function_base
+            N: int
+                Число узлов сетки
+            n_steps: int
+                Число шагов по времени в замере (физическое время - n_steps * dx * Cu)
+            Cu: float
+                Число Куранта
+            memory_steps: int
+                Число шагов отдельного короткого расчёта, в котором
+                tracemalloc измеряет пиковую память (чтобы не искажать время)
+            repeats: int
+                Число повторов замера времени; берётся лучший результат,
+                первый повтор заодно прогревает кэши
+            runner_kw:
+                Дополнительные аргументы utils.main_runner (например, backend)
+
+        Выход:
+            result: dict
+                'node_updates_per_sec' - N * число шагов / лучшее время расчёта
+                'wall_seconds', 'wall_seconds_median' - лучшее и медианное время
+                'wall_seconds_spread' - относительный разброс времени по повторам,
+                    (медиана - лучшее) / лучшее
+                'rhs_per_step' - вычислений правой части на шаг
+                'peak_memory_bytes' - пиковая память, выделенная за расчёт
+                'error' - L2-ошибка по get_error относительно точного решения
+                'cpu_seconds' - лучшее процессорное время расчёта
+                'error_x_cpu_seconds' - ошибка, умноженная на процессорное время
+                    (точность против стоимости: чем меньше, тем лучше)
+    """
+    mesh = models.Mesh(XLEFT, XRIGHT, N)
+    task_params = models.TaskParams(halfsinus, uniform_speed, zero_rightfunc)
+    total_time = n_steps * mesh.dx * Cu
+
+    tracemalloc.start()
+    utils.main_runner(task_params, mesh, Cu, memory_steps * mesh.dx * Cu, time_step_method,
+                      space_deriv_approx_method, memory_steps, show_progress=False, **runner_kw)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    wall_times = []
+    cpu_times = []
+    for repeat in range(repeats):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        U, time_steps = utils.main_runner(task_params, mesh, Cu, total_time, time_step_method,
+                                          space_deriv_approx_method, 10 * n_steps, show_progress=False,
+                                          **runner_kw)
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+    wall_seconds = min(wall_times)
+    wall_seconds_median = float(np.median(wall_times))
+    cpu_seconds = min(cpu_times)
+
+    U_exact = PreciseSolutions.transport_eq_solution(task_params.init_cond, mesh, SPEED, total_time)
+    error = float(utils.get_error(U, U_exact, mesh))
+    steps_done = len(time_steps)
+    return {
+        "time_step_method" : time_step_method,
+        "space_deriv_approx_method" : space_deriv_approx_method,
+        "N" : N,
+        "n_steps" : steps_done,
+        "repeats" : repeats,
+        "wall_seconds" : wall_seconds,
+        "wall_seconds_median" : wall_seconds_median,
+        "wall_seconds_spread" : (wall_seconds_median - wall_seconds) / wall_seconds,
+        "cpu_seconds" : cpu_seconds,
+        "node_updates_per_sec" : N * steps_done / wall_seconds,
+        "rhs_per_step" : time_steps.n_rhs_calls / steps_done,
+        "peak_memory_bytes" : peak_memory,
+        "error" : error,
+        "error_x_cpu_seconds" : error * cpu_seconds,
+    }
+
+
+def run_all(sizes=(3001, 30001, 1000001), time_step_methods=None, space_deriv_approx_methods=None,
+            verbose=True, out=None, **case_kw):
+    """ Замер всех сочетаний методов на всех размерах сетки.
+
+        Вход:
+            sizes: list[int]
+                Числа узлов сеток
+            time_step_methods: list[str]
+                Методы по времени; по умолчанию - все ключи runge_cutta_funcions_base
+            space_deriv_approx_methods: list[str]
+                Шаблоны; по умолчанию - все ключи dUdx_function_base, кроме спектральных
+                (им нужна периодическая граница, а задача замера - непериодическая)
+            verbose: bool
+                Печатать результаты по мере получения
+            out: str
+                Файл результатов (см. save_results); перезаписывается после
+                каждого сочетания, чтобы ошибка в одном расчёте не теряла остальные
+            case_kw:
+                Аргументы run_case
+
+        Выход:
+            results: list[dict]
+                Результаты run_case
+    """
+    if time_step_methods is None:
+        time_step_methods = list(RungeCuttaMethods.runge_cutta_funcions_base)
+    if space_deriv_approx_methods is None:
+        space_deriv_approx_methods = [name for name in SpaceDerivApproxMethods.dUdx_function_base
+                                      if name not in SpaceDerivApproxMethods.spectral_methods_base]
+
+    results = []
+    for N in sizes:
+        for time_step_method in time_step_methods:
+            for space_deriv_approx_method in space_deriv_approx_methods:
+                result = run_case(time_step_method, space_deriv_approx_method, N, **case_kw)
+                results.append(result)
+                if out is not None:
+                    save_results(results, out)
+                if verbose:
+                    print(f"{time_step_method:>8} + {space_deriv_approx_method:<8} N={N:<8} "
+                          f"{result['node_updates_per_sec']:.3e} node-updates/s  "
+                          f"{result['rhs_per_step']:.1f} rhs/step  "
+                          f"{result['peak_memory_bytes'] / 2**20:.1f} MiB  "
+                          f"err={result['error']:.2e}")
+    return results
+
+
+def save_results(results, path):
+    """ Сохранение результатов в JSON или CSV (по расширению файла) """
+    if str(path).endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        return
+    with open(path, "w") as f:
+        json.dump({"machine" : platform.platform(), "results" : results}, f, indent=1)
+
+
+def load_results(path):
+    """ Чтение результатов, сохранённых save_results в JSON """
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare_with_baseline(results, baseline, tolerance=0.1):
+    """ Поиск регрессий относительно сохранённого базового замера.
+
+        Вход:
+            results, baseline: list[dict]
+                Текущие и базовые результаты
+            tolerance: float
+                Допустимое относительное падение пропускной способности
+                (и рост памяти). Для времени допуск не меньше суммы
+                разбросов wall_seconds_spread обоих замеров, чтобы шум
+                коротких расчётов не считался регрессией
+
+        Выход:
+            regressions: list[dict]
+                Сочетания, для которых node_updates_per_sec упал
+                или peak_memory_bytes вырос больше допуска
+    """
+    def key(result):
+        return (result["time_step_method"], result["space_deriv_approx_method"], result["N"])
+
+    baseline_kw = {key(result) : result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_kw.get(key(result))
+        if base is None:
+            continue
+        speed_ratio = result["node_updates_per_sec"] / base["node_updates_per_sec"]
+        memory_ratio = result["peak_memory_bytes"] / max(base["peak_memory_bytes"], 1)
+        speed_tolerance = max(tolerance, result.get("wall_seconds_spread", 0.0) + base.get("wall_seconds_spread", 0.0))
+        if speed_ratio < 1 - speed_tolerance or memory_ratio > 1 + tolerance:
+            regressions.append({
+                "time_step_method" : result["time_step_method"],
+                "space_deriv_approx_method" : result["space_deriv_approx_method"],
+                "N" : result["N"],
+                "speed_ratio" : speed_ratio,
+                "speed_tolerance" : speed_tolerance,
+                "memory_ratio" : memory_ratio,
+            })
+    return regressions
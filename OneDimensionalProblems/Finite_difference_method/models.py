@@ -1,3 +1,6 @@
+import copy
+import hashlib
+
 import numpy as np
 
 class Mesh:
@@ -23,6 +26,35 @@ class Mesh:
         self.xnodes = np.linspace(xleft, xright, N)
         self.dx = self.xnodes[1] - self.xnodes[0]
 
+    # на равномерной сетке шаблоны производных задаются коэффициентами, делёнными на dx
+    uniform = True
+
+    def get_node_volumes(self):
+        """ Длины отрезков, приходящихся на узлы (для квадратурных норм)
+        """
+        return self.dx
+
+    def get_local_dx(self):
+        """ Шаг сетки около каждого узла (для локального условия Куранта)
+        """
+        return self.dx
+
+    def get_key(self):
+        """ Ключ, однозначно задающий узлы сетки (для кэширования)
+        """
+        return (type(self).__name__, self.xleft, self.xright, self.N)
+
+    def get_submesh(self, start_ind, finish_ind):
+        """ Часть сетки с узлами xnodes[start_ind:finish_ind].
+            Узлы не пересчитываются, а берутся срезом исходной сетки.
+        """
+        submesh = copy.copy(self)
+        submesh.xnodes = self.xnodes[start_ind:finish_ind]
+        submesh.xleft = submesh.xnodes[0]
+        submesh.xright = submesh.xnodes[-1]
+        submesh.N = submesh.xnodes.shape[0]
+        return submesh
+
     def get_twice_grid(self):
         """ Метод, который создаёт сетку в два раза подробнее
         """
@@ -30,27 +62,178 @@ class Mesh:
         return Mesh(self.xleft, self.xright, new_N)
 
 
+class NonuniformMesh(Mesh):
+    """ Одномерная неравномерная сетка с произвольными узлами.
+
+        Атрибут dx - наименьшее расстояние между соседними узлами,
+        так что шаг по времени dx * Cu удовлетворяет условию Куранта
+        в самой мелкой ячейке. Производные на такой сетке вычисляются
+        весами, построенными для каждого узла отдельно
+        (см. SpaceDerivApproxMethods.NonuniformStencilOperator).
+    """
+
+    uniform = False
+
+    def __init__(self, xnodes):
+        """
+        Вход:
+            xnodes : np.array
+                Возрастающий массив узлов сетки
+        """
+        xnodes = np.asarray(xnodes, dtype=np.float64)
+        steps = np.diff(xnodes)
+        if np.any(steps <= 0):
+            raise ValueError("Узлы сетки должны строго возрастать")
+        self.xnodes = xnodes
+        self.xleft = xnodes[0]
+        self.xright = xnodes[-1]
+        self.N = xnodes.shape[0]
+        self.steps = steps
+        self.dx = steps.min()
+
+    @classmethod
+    def from_refined_cells(cls, xleft, xright, N, refined_cells, ratio):
+        """ Блочно измельчённая сетка: ячейки равномерной сетки Mesh(xleft, xright, N),
+            отмеченные в refined_cells, делятся на ratio равных частей.
+            Узлы грубой сетки остаются узлами новой сетки.
+
+            Вход:
+                xleft, xright, N:
+                    Параметры грубой равномерной сетки
+                refined_cells : np.array[bool]
+                    Массив длины N - 1: какие ячейки измельчать
+                ratio : int
+                    Коэффициент измельчения
+
+            Выход:
+                mesh : NonuniformMesh
+        """
+        coarse_nodes = np.linspace(xleft, xright, N)
+        dx = coarse_nodes[1] - coarse_nodes[0]
+        counts = np.where(refined_cells, ratio, 1)
+        # номер грубой ячейки и номер узла внутри неё для каждого нового узла
+        cells = np.repeat(np.arange(N - 1), counts)
+        starts = np.cumsum(counts) - counts
+        local = np.arange(cells.shape[0]) - starts[cells]
+        xnodes = coarse_nodes[cells] + local * (dx / counts[cells])
+        return cls(np.append(xnodes, coarse_nodes[-1]))
+
+    def get_node_volumes(self):
+        """ Длины отрезков, приходящихся на узлы: половина соседних ячеек
+        """
+        volumes = np.empty(self.N)
+        volumes[:-1] = self.steps / 2
+        volumes[-1] = 0
+        volumes[1:] += self.steps / 2
+        return volumes
+
+    def get_local_dx(self):
+        """ Шаг сетки около каждого узла: меньшая из двух соседних ячеек
+        """
+        local_dx = np.empty(self.N)
+        local_dx[:-1] = self.steps
+        local_dx[-1] = self.steps[-1]
+        local_dx[1:-1] = np.minimum(self.steps[:-1], self.steps[1:])
+        return local_dx
+
+    def get_key(self):
+        """ Ключ, однозначно задающий узлы сетки (для кэширования)
+        """
+        return (type(self).__name__, self.N, hashlib.sha1(self.xnodes.tobytes()).hexdigest())
+
+    def get_submesh(self, start_ind, finish_ind):
+        """ Часть сетки с узлами xnodes[start_ind:finish_ind]
+        """
+        return NonuniformMesh(self.xnodes[start_ind:finish_ind])
+
+    def get_twice_grid(self):
+        """ Сетка с дополнительным узлом в середине каждой ячейки
+        """
+        xnodes = np.empty(2 * self.N - 1)
+        xnodes[::2] = self.xnodes
+        xnodes[1::2] = self.xnodes[:-1] + self.steps / 2
+        return NonuniformMesh(xnodes)
+
+
 
 class TaskParams:
     """ Описание параметров уравнения переноса.
     """
-    def __init__(self, init_cond, speed_function, right_function):
+    def __init__(self, init_cond, speed_function, right_function, stiff_coef=None, flux_function=None):
         """ В уравнении переноса могут варьироваться:
                 - начальное условие (init_cond)
                 - скорость (speed_function)
                 - функция правой части (right_function)
+                - жёсткий линейный источник (stiff_coef)
+                - поток (flux_function) для уравнения в дивергентной форме
             
             Вход:
                 init_cond : function
                     Функция одного переменного - координаты x,
-                    возвращая значение функции в точке x в начальный момент времени
+                    возвращая значение функции в точке x в начальный момент времени.
+                    Может быть векторизованной (см. vectorized)
                 speed_function : function
                     Функция двух переменных - сетки mesh и решения U,
                     возвращающая скорость на всей оси OX
                 right_function : function
                     Функция правой части, зависящая от (mesh, t, U),
                     возвращающая значение правой части на всей оси OX
+                stiff_coef : function
+                    Необязательная функция сетки mesh, возвращающая коэффициент
+                    релаксации sigma >= 0 на всей оси OX. Тогда к правой части
+                    добавляется жёсткий источник -sigma * U, который неявные
+                    методы обрабатывают неявно.
+                flux_function : function
+                    Необязательная функция (mesh, U), возвращающая поток F(U).
+                    Тогда решается уравнение dU/dt + dF/dx = f - sigma * U,
+                    а speed_function должна возвращать характеристическую
+                    скорость dF/dU (например, U для уравнения Бюргерса с F = U**2 / 2):
+                    по ней выбираются шаг по времени и направление против потока.
         """
         self.init_cond = init_cond
         self.speed_function = speed_function
         self.right_function = right_function
+        self.stiff_coef = stiff_coef
+        self.flux_function = flux_function
+
+
+def vectorized(init_cond):
+    """ Декоратор, помечающий начальное условие как векторизованное:
+        функция принимает весь массив узлов и возвращает массив значений.
+    """
+    init_cond.vectorized = True
+    return init_cond
+
+
+def evaluate_init_cond(init_cond, x):
+    """ Вычисление функции одного переменного во всех узлах.
+
+        Если функция помечена декоратором vectorized, она вызывается
+        один раз на всём массиве x. Если она помечена vectorized = False,
+        вызывается поточечно. Иначе сначала делается попытка вызвать её
+        на массиве, и если функция не умеет работать с массивами
+        (например, impuls с условием if x < ...), она вызывается поточечно.
+
+        Вход:
+            init_cond: function
+                Функция одного переменного x
+            x: np.array
+                Массив узлов
+
+        Выход:
+            U: np.array
+                Значения init_cond в узлах x
+    """
+    is_vectorized = getattr(init_cond, 'vectorized', None)
+    if is_vectorized is not False:
+        try:
+            U = np.asarray(init_cond(x))
+        except (ValueError, TypeError):
+            if is_vectorized:
+                raise
+            U = None
+        if U is not None and U.shape == x.shape:
+            return U
+        if is_vectorized:
+            raise ValueError("Векторизованное начальное условие вернуло массив неверной формы")
+    return np.array([init_cond(xx) for xx in x])
@@ -0,0 +1,164 @@
+""" Параметрические расчёты: перебор методов, сеток и чисел Куранта
+    с распределением расчётов по пулу процессов.
+"""
+
+import utils
+import PreciseSolutions
+import RungeCuttaMethods
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+
+def get_sweep_cases(time_step_methods_list, space_deriv_approx_methods_list, mesh_names_list, Cu_list):
+    """ Декартово произведение параметров расчёта.
+
+        Вход:
+            time_step_methods_list: list[str]
+                Названия методов аппроксимации временной производной
+            space_deriv_approx_methods_list: list[str]
+                Названия методов аппроксимации пространственной производной
+            mesh_names_list: list[str]
+                Имена сеток (ключи словаря meshes_kw)
+            Cu_list: list[float]
+                Числа Куранта
+
+        Выход:
+            cases: list[tuple]
+                Список кортежей (time_step_method, space_deriv_approx_method, mesh_name, Cu)
+    """
+    return list(itertools.product(time_step_methods_list, space_deriv_approx_methods_list, mesh_names_list, Cu_list))
+
+
+def estimate_case_cost(case, meshes_kw, total_time):
+    """ Оценка трудоёмкости расчёта: число узлов * число шагов * число стадий.
+        Используется только для упорядочивания расчётов.
+    """
+    time_step_method, space_deriv_approx_method, mesh_name, Cu = case
+    mesh = meshes_kw[mesh_name]
+    n_steps = np.ceil(total_time / (mesh.dx * Cu))
+    n_stages = RungeCuttaMethods.get_stages_number(time_step_method)
+    return mesh.N * n_steps * n_stages
+
+
+def _run_case(task_params, mesh, Cu, total_time, time_step_method, space_deriv_approx_method, N_iter_max,
+              runner_kw):
+    """ Один расчёт в процессе-работнике. """
+    return utils.main_runner(task_params, mesh, Cu, total_time, time_step_method,
+                             space_deriv_approx_method, N_iter_max, show_progress=False, **runner_kw)
+
+
+def iter_sweep(task_params, cases, meshes_kw, total_time, N_iter_max, max_workers=None, runner_kw=None):
+    """ Выполняет расчёты в пуле процессов и выдаёт результаты по мере готовности.
+
+        Расчёты отправляются в пул от самых трудоёмких к самым лёгким,
+        чтобы большая сетка не оказалась последней в очереди.
+
+        ProcessPoolExecutor передаёт task_params работнику через pickle
+        при каждом submit, поэтому функции задачи должны быть определены
+        через def на уровне модуля (или ячейки ноутбука); lambda и вложенные
+        функции не передаются ни при каком способе запуска процессов
+        (см. utils.get_mp_context).
+
+        Вход:
+            task_params: TaskParams
+                Описание параметров уравнения переноса
+            cases: list[tuple]
+                Кортежи (time_step_method, space_deriv_approx_method, mesh_name, Cu),
+                например из get_sweep_cases
+            meshes_kw: dict[str, Mesh]
+                Сетки по именам
+            total_time: float
+                Физическое время, до которого нужно считать
+            N_iter_max : int
+                Максимальное число итераций в одном расчёте
+            max_workers : int
+                Число процессов; по умолчанию - число ядер
+            runner_kw : dict
+                Дополнительные аргументы main_runner, общие для всех расчётов
+                (например, boundary, upwind, precision)
+
+        Выход (генератор):
+            case, U, time_steps
+                Параметры расчёта и результат main_runner
+    """
+    runner_kw = dict() if runner_kw is None else runner_kw
+    ordered_cases = sorted(cases, key=lambda case: estimate_case_cost(case, meshes_kw, total_time), reverse=True)
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=utils.get_mp_context()) as executor:
+        futures = {}
+        for case in ordered_cases:
+            time_step_method, space_deriv_approx_method, mesh_name, Cu = case
+            future = executor.submit(_run_case, task_params, meshes_kw[mesh_name], Cu, total_time,
+                                     time_step_method, space_deriv_approx_method, N_iter_max, runner_kw)
+            futures[future] = case
+
+        for future in as_completed(futures):
+            U, time_steps = future.result()
+            yield futures[future], U, time_steps
+
+
+def run_sweep(task_params, cases, meshes_kw, total_time, N_iter_max, speed=None, max_workers=None, verbose=True,
+              runner_kw=None):
+    """ Выполняет параметрический расчёт и, если известна постоянная скорость,
+        строит таблицы ошибок и порядков сходимости.
+
+        Вход:
+            speed: float
+                Постоянная скорость переноса для аналитического решения.
+                Если не задана, ошибки не вычисляются.
+            verbose: bool
+                Печатать ли завершённые расчёты по мере готовности
+            остальные аргументы - как в iter_sweep
+
+        Выход:
+            results: dict
+                'solutions' : {case: U} - численные решения
+                'time_steps' : {case: time_steps} - шаги по времени
+                'errors' : {(time_step_method, space_deriv_approx_method, Cu): np.array (2, n_meshes)}
+                    строка 0 - dx, строка 1 - ошибка, сетки упорядочены от грубой к подробной
+                'orders' : {(time_step_method, space_deriv_approx_method, Cu): np.array (n_meshes - 1,)}
+                    порядки сходимости по парам соседних сеток
+    """
+    solutions_kw = dict()
+    time_steps_kw = dict()
+    for case, U, time_steps in iter_sweep(task_params, cases, meshes_kw, total_time, N_iter_max, max_workers,
+                                          runner_kw):
+        if verbose:
+            print(" + ".join(str(p) for p in case))
+        solutions_kw[case] = U
+        time_steps_kw[case] = time_steps
+
+    results = {
+        "solutions" : solutions_kw,
+        "time_steps" : time_steps_kw,
+        "errors" : dict(),
+        "orders" : dict(),
+    }
+    if speed is None:
+        return results
+
+    analitical_solutions = dict()
+    for mesh_name in set(case[2] for case in cases):
+        analitical_solutions[mesh_name] = PreciseSolutions.transport_eq_solution(
+            task_params.init_cond, meshes_kw[mesh_name], speed, total_time)
+
+    groups = dict()
+    for (time_step_method, space_deriv_approx_method, mesh_name, Cu) in solutions_kw:
+        groups.setdefault((time_step_method, space_deriv_approx_method, Cu), []).append(mesh_name)
+
+    for key, mesh_names in groups.items():
+        time_step_method, space_deriv_approx_method, Cu = key
+        mesh_names = sorted(mesh_names, key=lambda name: meshes_kw[name].dx, reverse=True)
+        errors = np.zeros((2, len(mesh_names)))
+        for i, mesh_name in enumerate(mesh_names):
+            mesh = meshes_kw[mesh_name]
+            U_num = solutions_kw[(time_step_method, space_deriv_approx_method, mesh_name, Cu)]
+            errors[0, i] = mesh.dx
+            errors[1, i] = utils.get_error(U_num, analitical_solutions[mesh_name], mesh)
+        results["errors"][key] = errors
+        results["orders"][key] = np.array([utils.grid_conv_by_true(errors[1, i], errors[1, i+1])
+                                           for i in range(len(mesh_names) - 1)])
+    return results
@@ -1,18 +1,150 @@
 import SpaceDerivApproxMethods
 import RungeCuttaMethods
+import NumbaKernels
+import Checkpoints
+import models
+
+import sys
+import time
+import warnings
+import multiprocessing
 
 import numpy as np
 from tqdm import tqdm
 
 
-def get_dt(cur_t, total_time, mesh, Cu, U_curr):
+def get_dt(cur_t, total_time, mesh, Cu, U_curr, speed=None):
     """ Вычисление временного шага для численного решения
         уравнения переноса.
+
+        Если скорость не задана, dt = mesh.dx * Cu (Cu - отношение dt к dx).
+        На неравномерной сетке mesh.dx - наименьшее расстояние между узлами,
+        то есть шаг выбирается по условию Куранта в самой мелкой ячейке.
+        Если задана скорость, Cu - число Куранта: |speed| * dt <= Cu * dx
+        в каждом узле, с локальным шагом сетки mesh.get_local_dx().
     """
-    dt = mesh.dx * Cu
+    if speed is None:
+        dt = mesh.dx * Cu
+    else:
+        max_rate = np.max(np.abs(speed) / mesh.get_local_dx())
+        dt = Cu / max_rate if max_rate > 0 else mesh.dx * Cu
     if cur_t + dt > total_time:
         dt = total_time - cur_t
-    return dt
+    # время и шаг - всегда float64, даже если скорость во float32
+    return float(dt)
+
+
+def get_cfl_speed(task_params, mesh, U, speed_cfl):
+    """ Скорость для выбора шага по времени (см. get_dt): вычисляется
+        один раз в начале шага, если speed_cfl, иначе None
+    """
+    if not speed_cfl:
+        return None
+    return task_params.speed_function(mesh, U)
+
+
+def get_error_norm(U_err, U_curr, U_new, rtol, atol, size=None):
+    """ Взвешенная среднеквадратичная норма оценки локальной ошибки
+        для управления шагом по времени.
+
+        Вход:
+            U_err: np.array
+                Оценка локальной ошибки шага (разность решений вложенной пары)
+            U_curr, U_new: np.array
+                Решение в начале и в конце шага
+            rtol, atol: float
+                Относительный и абсолютный допуск
+            size: int
+                Полное число значений, по которому усредняется ошибка.
+                Задаётся, если массивы - часть решения (активное окно),
+                а вне их ошибка равна нулю. По умолчанию - U_err.size
+
+        Выход:
+            err_norm: float
+                Норма ошибки; шаг принимается, если err_norm <= 1
+    """
+    size = U_err.size if size is None else size
+    scale = atol + rtol * np.maximum(np.abs(U_curr), np.abs(U_new))
+    err_norm = np.sqrt(np.sum((U_err / scale)**2) / size)
+    return float(err_norm)
+
+
+def get_active_window(U, window, halo, tol):
+    """ Активное окно - участок сетки, на котором решение может измениться за шаг.
+
+        Вход:
+            U: np.array
+                Текущее решение (N,) или (n_members, N)
+            window: tuple(int, int)
+                Участок [start_ind, finish_ind), вне которого U равно нулю
+            halo: int
+                Число узлов, на которое окно расширяется в обе стороны от носителя
+            tol: float
+                Значения |U| <= tol считаются нулевыми
+
+        Выход:
+            window: tuple(int, int)
+                Новое окно [start_ind, finish_ind); пустое, если U равно нулю
+    """
+    start_ind, finish_ind = window
+    active = np.abs(U[..., start_ind:finish_ind]) > tol
+    if U.ndim > 1:
+        active = active.any(axis=tuple(range(U.ndim - 1)))
+    support = np.flatnonzero(active)
+    if support.shape[0] == 0:
+        return (start_ind, start_ind)
+    N = U.shape[-1]
+    return (max(0, start_ind + support[0] - halo), min(N, start_ind + support[-1] + 1 + halo))
+
+
+def get_adaptive_dt(dt, err_norm, embedded_order, accepted,
+                    safety=0.9, fac_min=0.2, fac_max=5.0):
+    """ Новый шаг по времени по оценке ошибки вложенной пары.
+
+        Вход:
+            dt: float
+                Шаг, с которым была получена оценка ошибки
+            err_norm: float
+                Норма ошибки (см. get_error_norm)
+            embedded_order: int
+                Порядок младшего метода вложенной пары
+            accepted: bool
+                Был ли шаг принят; после отказа шаг не увеличивается
+            safety, fac_min, fac_max: float
+                Коэффициент запаса и границы изменения шага
+
+        Выход:
+            dt_new: float
+                Предлагаемый следующий шаг
+    """
+    if err_norm == 0:
+        factor = fac_max
+    else:
+        factor = safety * err_norm ** (-1 / (embedded_order + 1))
+    if not accepted:
+        fac_max = 1.0
+    factor = min(fac_max, max(fac_min, factor))
+    return dt * factor
+
+
+class TimeStepsHistory(list):
+    """ Список принятых шагов по времени со счётчиками работы алгоритма.
+
+        Атрибуты:
+            n_accepted : int
+                Число принятых шагов
+            n_rejected : int
+                Число отвергнутых шагов (только для адаптивного шага)
+            n_rhs_calls : int
+                Число вычислений правой части
+            dt_next : float
+                Шаг, предложенный адаптивным выбором шага для продолжения
+                расчёта (None для постоянного шага)
+    """
+    n_accepted = 0
+    n_rejected = 0
+    n_rhs_calls = 0
+    dt_next = None
 
 
 def get_init_field(mesh, init_cond):
@@ -22,43 +154,186 @@ def get_init_field(mesh, init_cond):
             mesh: Mesh
                 Сетка на которой вычисляется решение
             init_cond: function
-                Функция одного переменного - начальное условие
+                Функция одного переменного - начальное условие.
+                Может быть векторизованной (см. models.evaluate_init_cond)
         
         Выход:
             U: np.array
                 Значения init_cond в узлах сетки mesh
     """
-    U = np.array([init_cond(x) for x in mesh.xnodes])
+    U = models.evaluate_init_cond(init_cond, mesh.xnodes)
     return U
 
 
-def generate_right_function_for_dUdt_problem(task_params, space_deriv_approx_method):
+def generate_right_function_for_dUdt_problem(task_params, space_deriv_approx_method, mesh=None, boundary="zero",
+                                             include_stiff=True, upwind=False, profiler=None):
     """ Создание правой функции для решения задачи dU/dt = F,
-        Для нашей задачи F = f - speed*dU/dx.
+        Для нашей задачи F = f - sigma*U - speed*dU/dx,
+        а если задан поток task_params.flux_function, то F = f - sigma*U - dF/dx.
         
         Вход:
             task_params: TaskParams
                 Параметры уравнения переноса: скорость и функция правой части
             space_deriv_approx_method: str
                 Название метода вычисления пространственной производной
+            mesh: Mesh
+                Сетка, на которой будет решаться задача. Если задана,
+                производная вычисляется оператором StencilOperator,
+                построенным один раз для этой сетки, в переиспользуемый массив.
+            boundary: str
+                Граничное замыкание оператора: "zero", "one-sided" или "periodic"
+            include_stiff: bool
+                Добавлять ли жёсткий источник -sigma*U (task_params.stiff_coef).
+                Неявно-явные методы учитывают его отдельно.
+            upwind: bool
+                Выбирать направление шаблона в каждом узле по знаку скорости:
+                при speed >= 0 используется шаблон как есть, при speed < 0 -
+                его зеркальное отражение (см. SpaceDerivApproxMethods.get_mirrored_stencil).
+                Для центральных шаблонов ничего не меняет. Только при заданной mesh.
+            profiler: Profiling.Profiler
+                Если задан, время оператора производной учитывается в этапе "stencil"
         
         Выход:
             right_function_for_dUdt_problem: function
                 Функция правой части, которую мы пошлём в метод Рунге-Кутты.
                 Эта функция должна быть функцией 3-ёх аргументов: xmesh, t, U
     """
-    dUdx_function = SpaceDerivApproxMethods.generate_dUdx_function(space_deriv_approx_method)
-    
+    stiff_coef = task_params.stiff_coef if include_stiff else None
+    flux_function = task_params.flux_function
+
+    if mesh is None:
+        if upwind:
+            raise ValueError("Выбор направления против потока требует задать сетку mesh")
+        dUdx_function = SpaceDerivApproxMethods.generate_dUdx_function(space_deriv_approx_method)
+
+        def new_right_func(mesh, t, U):
+            scr_right_func_arr = task_params.right_function(mesh, t, U)
+            if flux_function is None:
+                speed_dUdx_arr = task_params.speed_function(mesh, U) * dUdx_function(U, mesh)
+            else:
+                speed_dUdx_arr = dUdx_function(flux_function(mesh, U), mesh)
+            if stiff_coef is not None:
+                scr_right_func_arr = scr_right_func_arr - stiff_coef(mesh) * U
+            return scr_right_func_arr - speed_dUdx_arr
+
+        return new_right_func
+
+    dUdx_operator = SpaceDerivApproxMethods.generate_dUdx_operator(space_deriv_approx_method, mesh, boundary)
+    mirrored_operator = None
+    if upwind and not SpaceDerivApproxMethods.is_symmetric_stencil(space_deriv_approx_method):
+        mirrored_operator = SpaceDerivApproxMethods.generate_dUdx_operator(space_deriv_approx_method, mesh,
+                                                                           boundary, mirrored=True)
+    if profiler is not None:
+        dUdx_operator = profiler.wrap("stencil", dUdx_operator)
+        if mirrored_operator is not None:
+            mirrored_operator = profiler.wrap("stencil", mirrored_operator)
+    buffers = {}
+    mirrored_buffers = {}
+
     def new_right_func(mesh, t, U):
+        dUdx = buffers.get(U.shape)
+        if dUdx is None:
+            dUdx = buffers[U.shape] = np.empty(U.shape)
         scr_right_func_arr = task_params.right_function(mesh, t, U)
-        speed_dUdx_arr = task_params.speed_function(mesh, U) * dUdx_function(U, mesh)
-        return scr_right_func_arr - speed_dUdx_arr
-    
+        F = U if flux_function is None else flux_function(mesh, U)
+        dUdx_operator(F, out=dUdx)
+        if mirrored_operator is not None or flux_function is None:
+            speed = task_params.speed_function(mesh, U)
+        if mirrored_operator is not None:
+            dUdx_mirrored = mirrored_buffers.get(U.shape)
+            if dUdx_mirrored is None:
+                dUdx_mirrored = mirrored_buffers[U.shape] = np.empty(U.shape)
+            mirrored_operator(F, out=dUdx_mirrored)
+            np.copyto(dUdx, dUdx_mirrored, where=np.broadcast_to(speed, U.shape) < 0)
+        if flux_function is None:
+            np.multiply(speed, dUdx, out=dUdx)
+        if stiff_coef is not None:
+            dUdx += stiff_coef(mesh) * U
+        return scr_right_func_arr - dUdx
+
     return new_right_func
 
 
+def _get_shared_field(values, N, name):
+    """ Поле длины N, общее для всех членов набора решений.
+        Неявная матрица одна на весь набор, поэтому поле, разное
+        у членов набора (форма (n_members, 1) или (n_members, N)), в неё не входит.
+    """
+    values = np.asarray(values)
+    if values.ndim > 1:
+        rows = values.reshape(-1, values.shape[-1])
+        if not np.all(rows == rows[0]):
+            raise ValueError(f"Для неявной части IMEX-метода {name} должен быть общим для всех членов"
+                             " набора; используйте явный метод или метод с явным переносом")
+        values = rows[0]
+    return np.broadcast_to(values, (N,))
+
+
+def generate_imex_problem(task_params, space_deriv_approx_method, mesh, boundary, implicit_advection, U0,
+                          upwind=False):
+    """ Разбиение правой части на явную функцию и неявную матрицу
+        для неявно-явных методов: dU/dt = F_explicit(mesh, t, U) + L U.
+
+        Вход:
+            task_params: TaskParams
+                Параметры уравнения переноса
+            space_deriv_approx_method: str
+                Название метода вычисления пространственной производной
+            mesh: Mesh
+                Сетка, на которой решается задача
+            boundary: str
+                Граничное замыкание оператора производной
+            implicit_advection: bool
+                Если True, перенос -speed*dU/dx входит в L вместе с жёстким
+                источником; скорость при этом берётся по U0 и считается
+                не зависящей от решения. Если False, в L входит только
+                жёсткий источник, а перенос считается явно.
+            U0: np.array
+                Начальное поле (для вычисления скорости)
+            upwind: bool
+                Выбор направления шаблона по знаку скорости
+                (см. generate_right_function_for_dUdt_problem)
+
+        Выход:
+            explicit_function: function
+                Явная часть правой части, функция (mesh, t, U)
+            implicit_operator: scipy.sparse.csr_matrix
+                Матрица L размера (mesh.N, mesh.N)
+    """
+    import scipy.sparse
+
+    if task_params.stiff_coef is not None:
+        sigma = _get_shared_field(task_params.stiff_coef(mesh), mesh.N, "stiff_coef")
+    else:
+        sigma = np.zeros(mesh.N)
+    implicit_operator = -scipy.sparse.diags(sigma)
+
+    if implicit_advection:
+        if task_params.flux_function is not None:
+            raise ValueError("Нелинейный поток нельзя включить в неявную матрицу")
+        dUdx_matrix = SpaceDerivApproxMethods.generate_dUdx_operator(space_deriv_approx_method, mesh,
+                                                                     boundary).to_sparse()
+        speed = _get_shared_field(task_params.speed_function(mesh, U0), mesh.N, "speed_function")
+        if upwind and not SpaceDerivApproxMethods.is_symmetric_stencil(space_deriv_approx_method):
+            # строки с отрицательной скоростью берутся из отражённого шаблона
+            mirrored_matrix = SpaceDerivApproxMethods.generate_dUdx_operator(space_deriv_approx_method, mesh,
+                                                                             boundary, mirrored=True).to_sparse()
+            negative = scipy.sparse.diags((speed < 0).astype(np.float64))
+            dUdx_matrix = dUdx_matrix - negative @ dUdx_matrix + negative @ mirrored_matrix
+        implicit_operator = implicit_operator - scipy.sparse.diags(speed) @ dUdx_matrix
+        explicit_function = task_params.right_function
+    else:
+        explicit_function = generate_right_function_for_dUdt_problem(task_params, space_deriv_approx_method,
+                                                                     mesh, boundary, include_stiff=False,
+                                                                     upwind=upwind)
+    return explicit_function, implicit_operator.tocsr()
+
 
-def main_runner(task_params, mesh, Cu, total_time, time_step_method, space_deriv_approx_method, N_iter_max):
+
+def main_runner(task_params, mesh, Cu, total_time, time_step_method, space_deriv_approx_method, N_iter_max,
+                rtol=None, atol=None, show_progress=True, boundary="zero", active_window=False, window_tol=0.0,
+                backend="numpy", snapshot_writer=None, checkpoint_path=None, checkpoint_interval=600.0,
+                upwind=False, speed_cfl=False, profiler=None, progress_interval=0.5, precision="float64"):
     """ Основная функция для численного решения одномерного уравнения переноса.
         
         Вход:
@@ -71,41 +346,410 @@ def main_runner(task_params, mesh, Cu, total_time, time_step_method, space_deriv
             total_time: float
                 Физическое время, до которого нужно считать
             time_step_mathod: str
-                Название метода аппроксимации временной производной
+                Название метода аппроксимации временной производной.
+                Для неявно-явных методов ("IMEX-Euler", "CN", "SDIRK-2", "IMEX-ARS222")
+                нужен пакет scipy, а Cu может быть намного больше 1
             space_deriv_approx_method: str
                 Название метода аппроксимации производной по пространству
             N_iter_max : int
                 Максимальное число итераций
+            rtol, atol : float
+                Допуски для адаптивного шага по времени. Если задан хотя бы один,
+                шаг выбирается по оценке ошибки вложенной пары ("BS-32", "DP-54"),
+                а dt = mesh.dx * Cu используется только как начальный шаг.
+                Незаданный допуск берётся равным заданному.
+            show_progress : bool
+                Показывать ли индикатор выполнения tqdm. Если нет, tqdm не создаётся
+            boundary : str
+                Граничное замыкание пространственной производной:
+                "zero", "one-sided" или "periodic" (см. SpaceDerivApproxMethods.StencilOperator)
+            active_window : bool
+                Считать только активное окно: носитель решения (|U| > window_tol),
+                расширенный на (число стадий + 1) * ширину шаблона в каждую сторону.
+                Вне окна решение остаётся нулевым. Подходит для локализованных
+                решений, если правая часть равна нулю там, где U = 0;
+                только для явных методов и непериодической границы.
+            window_tol : float
+                Порог, ниже которого значения считаются нулевыми при поиске носителя.
+                При 0 результат совпадает с расчётом на всей сетке; для схем
+                с дисперсионными хвостами малый порог (например, 1e-12)
+                не даёт окну расползтись на всю сетку.
+            backend : str
+                "numpy" - обычный путь; "numba" - компилируемые ядра NumbaKernels,
+                объединяющие шаблон, скорость, источник и стадию метода в один
+                параллельный проход (только явные методы); "auto" - numba,
+                если она установлена. Без numba используется "numpy".
+            snapshot_writer : Snapshots.SnapshotWriter
+                Запись истории решения на диск: для начального условия и после
+                каждого принятого шага вызывается snapshot_writer.maybe_write(номер шага, t, U)
+            checkpoint_path : str
+                Файл контрольной точки (.npz). Если задан, состояние расчёта
+                сохраняется не чаще, чем раз в checkpoint_interval секунд
+                реального времени, и в конце расчёта; продолжить расчёт
+                можно функцией resume_runner
+            checkpoint_interval : float
+                Интервал между контрольными точками по реальному времени, с
+            upwind : bool
+                Выбирать направление смещённого шаблона в каждом узле по знаку скорости
+                (см. generate_right_function_for_dUdt_problem)
+            speed_cfl : bool
+                Выбирать шаг по времени по скорости: Cu становится числом Куранта,
+                а dt = Cu * min(dx / |speed|) вычисляется по решению в начале
+                каждого шага (см. get_dt). Для адаптивного шага - только начальный шаг
+            profiler : Profiling.Profiler
+                Замер времени по этапам (функции задачи, оператор производной,
+                комбинации стадий, запись на диск), обработчики on_step и on_stage
+                и отчёт profiler.report(). Без него цикл по времени не меняется
+            progress_interval : float
+                Наименьший интервал обновления индикатора выполнения, с
+            precision : str
+                Тип хранения решения и слоёв метода (см. precision_dtypes):
+                "float64" или "float32". При "float32" памяти и обращений к ней
+                вдвое меньше, а суммы стадий, производная по пространству и время
+                считаются в float64, так что решение округляется до float32
+                один раз на стадию. Отличие от расчёта во float64 и его оценка -
+                в benchmarks/precision.py
         
         Выход:
             U: np.array
                 Численное решение на сетке mesh.
-                Массив длины mesh.N
-            time_steps: np.array
-                массив шагов по времени, чтобы после можно
-                было проанализировать как работал алгоритм
+                Массив длины mesh.N типа precision
+            time_steps: TimeStepsHistory
+                список принятых шагов по времени, чтобы после можно
+                было проанализировать как работал алгоритм,
+                с числом принятых и отвергнутых шагов
     """
     U0 = get_init_field(mesh, task_params.init_cond)
+    return run_time_loop(task_params, U0, mesh, Cu, total_time, time_step_method,
+                         space_deriv_approx_method, N_iter_max, rtol=rtol, atol=atol,
+                         show_progress=show_progress, boundary=boundary,
+                         active_window=active_window, window_tol=window_tol, backend=backend,
+                         snapshot_writer=snapshot_writer, checkpoint_path=checkpoint_path,
+                         checkpoint_interval=checkpoint_interval, upwind=upwind, speed_cfl=speed_cfl,
+                         profiler=profiler, progress_interval=progress_interval, precision=precision)
+
+
+def ensemble_runner(task_params, init_conds, mesh, Cu, total_time, time_step_method, space_deriv_approx_method,
+                    N_iter_max, rtol=None, atol=None, show_progress=True, boundary="zero",
+                    active_window=False, window_tol=0.0, backend="numpy", snapshot_writer=None,
+                    checkpoint_path=None, checkpoint_interval=600.0, upwind=False, speed_cfl=False,
+                    profiler=None, progress_interval=0.5, precision="float64"):
+    """ Численное решение уравнения переноса сразу для набора начальных условий.
+
+        Все решения хранятся в одном двумерном массиве (n_members, N)
+        и продвигаются по времени вместе, так что накладные расходы Python
+        на шаг оплачиваются один раз на весь набор.
+        Для разных скоростей у членов набора task_params.speed_function
+        может возвращать массив формы (n_members, 1) или (n_members, N).
+        Исключение - неявно-явные методы: неявная матрица одна на весь набор,
+        поэтому скорость при неявном переносе ("CN", "SDIRK-2") и stiff_coef
+        должны быть общими для всех членов, иначе - ValueError.
+
+        Вход:
+            task_params: TaskParams
+                Описание параметров уравнения переноса (init_cond не используется)
+            init_conds: list[function]
+                Начальные условия членов набора
+            остальные аргументы - как в main_runner
+
+        Выход:
+            U: np.array
+                Численные решения, массив формы (len(init_conds), mesh.N)
+            time_steps: TimeStepsHistory
+                общий для всего набора список шагов по времени
+    """
+    U0 = np.stack([get_init_field(mesh, init_cond) for init_cond in init_conds])
+    return run_time_loop(task_params, U0, mesh, Cu, total_time, time_step_method,
+                         space_deriv_approx_method, N_iter_max, rtol=rtol, atol=atol,
+                         show_progress=show_progress, boundary=boundary,
+                         active_window=active_window, window_tol=window_tol, backend=backend,
+                         snapshot_writer=snapshot_writer, checkpoint_path=checkpoint_path,
+                         checkpoint_interval=checkpoint_interval, upwind=upwind, speed_cfl=speed_cfl,
+                         profiler=profiler, progress_interval=progress_interval, precision=precision)
+
+
+# типы хранения решения (аргумент precision в main_runner)
+precision_dtypes = {
+    "float64" : np.float64,
+    "float32" : np.float32,
+}
+
+
+def generate_explicit_stepper(task_params, shape, mesh, time_step_method, space_deriv_approx_method,
+                              boundary="zero", backend="numpy", upwind=False, dtype=np.float64):
+    """ Выбор реализации явного метода Рунге-Кутты.
+
+        Вход:
+            backend: str
+                "numpy", "numba" или "auto" (см. main_runner)
+            dtype: np.dtype
+                Тип хранения слоёв и решения
+            остальные аргументы - как в main_runner
+
+        Выход:
+            stepper: RungeCuttaStepper или NumbaKernels.FusedRungeCuttaStepper
+    """
+    if backend not in ("numpy", "numba", "auto"):
+        raise ValueError(f"Неизвестный backend: {backend}")
+    # ядра numba реализуют только линейный перенос с одним шаблоном на равномерной сетке
+    unsupported = []
+    if not mesh.uniform:
+        unsupported.append("неравномерную сетку")
+    if task_params.flux_function is not None:
+        unsupported.append("поток flux_function")
+    if space_deriv_approx_method in SpaceDerivApproxMethods.reconstructions_base:
+        unsupported.append(f"нелинейную реконструкцию {space_deriv_approx_method}")
+    elif space_deriv_approx_method in SpaceDerivApproxMethods.spectral_methods_base:
+        unsupported.append(f"спектральную производную {space_deriv_approx_method}")
+    elif space_deriv_approx_method not in SpaceDerivApproxMethods.stencils_base:
+        unsupported.append(f"производную {space_deriv_approx_method}")
+    if upwind and not SpaceDerivApproxMethods.is_symmetric_stencil(space_deriv_approx_method):
+        unsupported.append("выбор шаблона по знаку скорости")
+    if unsupported and backend != "numpy":
+        if backend == "numba":
+            warnings.warn("Ядра numba не поддерживают " + ", ".join(unsupported) + ", используется backend numpy")
+        backend = "numpy"
+    if backend != "numpy" and NumbaKernels.NUMBA_AVAILABLE:
+        dUdx_operator = SpaceDerivApproxMethods.generate_dUdx_operator(space_deriv_approx_method, mesh, boundary)
+        butcher_table = RungeCuttaMethods.butcher_tables_base[time_step_method]
+        return NumbaKernels.FusedRungeCuttaStepper(butcher_table, shape, task_params, dUdx_operator, dtype)
+    if backend == "numba":
+        warnings.warn("numba не установлена, используется backend numpy")
+    return RungeCuttaMethods.generate_stepper(time_step_method, shape, dtype=dtype)
+
+
+def run_time_loop(task_params, U0, mesh, Cu, total_time, time_step_method, space_deriv_approx_method,
+                  N_iter_max, rtol=None, atol=None, show_progress=True, boundary="zero",
+                  active_window=False, window_tol=0.0, backend="numpy", snapshot_writer=None,
+                  checkpoint_path=None, checkpoint_interval=600.0, upwind=False, speed_cfl=False,
+                  profiler=None, progress_interval=0.5, precision="float64", state=None):
+    """ Цикл по времени, начиная с заданного поля U0.
+
+        Вход:
+            U0: np.array
+                Начальное поле: массив длины mesh.N или (n_members, mesh.N)
+            state: dict
+                Состояние из контрольной точки (см. resume_runner)
+            остальные аргументы - как в main_runner
+
+        Выход:
+            как в main_runner
+    """
+    if precision not in precision_dtypes:
+        raise ValueError(f"Неизвестная точность: {precision}")
+    dtype = precision_dtypes[precision]
+    if profiler is not None:
+        task_params = profiler.wrap_task_params(task_params)
+
+    if RungeCuttaMethods.is_implicit(time_step_method):
+        implicit_advection = RungeCuttaMethods.imex_tables_base[time_step_method]['implicit_advection']
+        right_function_for_dUdt_problem, implicit_operator = generate_imex_problem(
+            task_params, space_deriv_approx_method, mesh, boundary, implicit_advection, U0, upwind=upwind)
+        stepper = RungeCuttaMethods.generate_stepper(time_step_method, U0.shape, implicit_operator, dtype=dtype)
+    else:
+        stepper = generate_explicit_stepper(task_params, U0.shape, mesh, time_step_method,
+                                            space_deriv_approx_method, boundary=boundary, backend=backend,
+                                            upwind=upwind, dtype=dtype)
+        right_function_for_dUdt_problem = generate_right_function_for_dUdt_problem(task_params, space_deriv_approx_method,
+                                                                                   mesh, boundary, upwind=upwind,
+                                                                                   profiler=profiler)
+    if profiler is not None:
+        right_function_for_dUdt_problem = profiler.wrap_right_function(right_function_for_dUdt_problem)
+        profiler.instrument_stepper(stepper)
     
-    get_next = RungeCuttaMethods.generate_get_next_function(time_step_method)
-    right_function_for_dUdt_problem = generate_right_function_for_dUdt_problem(task_params, space_deriv_approx_method)
-    
-    U_curr = U0.copy()
-    U_new = U0.copy()
+    # два буфера, которые меняются местами на каждом шаге
+    U_curr = U0.astype(dtype)
+    U_new = np.empty_like(U_curr)
+    N = U0.shape[-1]
     
+    adaptive = rtol is not None or atol is not None
+    if adaptive:
+        if not stepper.embedded:
+            raise ValueError(f"Метод {time_step_method} не содержит вложенной пары для оценки ошибки")
+        rtol = atol if rtol is None else rtol
+        atol = rtol if atol is None else atol
+        U_err = np.empty_like(U_curr)
+        dt_next = get_dt(0, total_time, mesh, Cu, U_curr, get_cfl_speed(task_params, mesh, U_curr, speed_cfl))
+        if state is not None:
+            dt_next = state['dt_next']
+
+    if active_window:
+        if RungeCuttaMethods.is_implicit(time_step_method) or boundary == "periodic" or not mesh.uniform:
+            raise ValueError("Активное окно возможно только для явных методов, непериодической границы"
+                             " и равномерной сетки")
+        min_ind, max_ind = SpaceDerivApproxMethods.get_stencil_indexes(space_deriv_approx_method)
+        # за один шаг ненулевые значения распространяются не дальше,
+        # чем на (число стадий) * (ширина шаблона) узлов
+        halo = (stepper.s + 1) * max(-min_ind, max_ind)
+        # участки, вне которых U_curr и U_new равны нулю
+        window_curr = (0, N) if state is None else state['window']
+        window_new = (0, N)
+        step_window = None
+
+    window_slice = Ellipsis
+    step_mesh = mesh
     _t = 0
-    time_steps = list()
-    for inter_num in tqdm(range(N_iter_max)):
+    time_steps = TimeStepsHistory()
+    iter_start = 0
+    if state is not None:
+        _t = state['t']
+        time_steps.extend(state['time_steps'])
+        time_steps.n_rejected = state['n_rejected']
+        stepper.n_rhs_calls = state['n_rhs_calls']
+        iter_start = state['iter_num']
+
+    write_snapshot = None if snapshot_writer is None else snapshot_writer.maybe_write
+    if write_snapshot is not None and profiler is not None:
+        write_snapshot = profiler.wrap("snapshot", write_snapshot)
+    if write_snapshot is not None and state is None:
+        write_snapshot(0, _t, U_curr)
+
+    if checkpoint_path is not None:
+        checkpoint_params = dict(
+            time_step_method=time_step_method,
+            space_deriv_approx_method=space_deriv_approx_method,
+            mesh_key=get_mesh_key(mesh),
+            Cu=Cu, total_time=total_time, N_iter_max=N_iter_max,
+            rtol=rtol, atol=atol, boundary=boundary,
+            active_window=active_window, window_tol=window_tol, backend=backend,
+            upwind=upwind, speed_cfl=speed_cfl, precision=precision,
+        )
+        last_checkpoint = time.perf_counter()
+
+    def write_checkpoint(iter_num):
+        time_steps.n_rhs_calls = stepper.n_rhs_calls
+        Checkpoints.save_checkpoint(checkpoint_path, U_curr, _t, iter_num, time_steps, checkpoint_params,
+                                    window=window_curr if active_window else None,
+                                    dt_next=dt_next if adaptive else None)
+
+    if checkpoint_path is not None and profiler is not None:
+        write_checkpoint = profiler.wrap("checkpoint", write_checkpoint)
+
+    iterations = range(iter_start, N_iter_max)
+    if show_progress:
+        iterations = tqdm(iterations, mininterval=progress_interval)
+    if profiler is not None:
+        profiler.start(time_step_method=time_step_method, space_deriv_approx_method=space_deriv_approx_method,
+                       shape=list(U0.shape), backend=backend, adaptive=adaptive, active_window=active_window,
+                       precision=precision)
+
+    iter_num = iter_start
+    for iter_num in iterations:
         if _t >= total_time:
             break
 
-        U_curr = U_new.copy()
-        dt = get_dt(_t, total_time, mesh, Cu, U_curr)
-        U_new = get_next(U_curr, _t, mesh, dt, right_function_for_dUdt_problem)
+        if not adaptive:
+            dt = get_dt(_t, total_time, mesh, Cu, U_curr, get_cfl_speed(task_params, mesh, U_curr, speed_cfl))
+        else:
+            dt = min(dt_next, total_time - _t)
+
+        if active_window:
+            window = get_active_window(U_curr, window_curr, halo, window_tol)
+            start_ind, finish_ind = window
+            # вне нового окна U_new должен быть нулевым
+            U_new[..., window_new[0]:start_ind] = 0
+            U_new[..., max(finish_ind, window_new[0]):window_new[1]] = 0
+            window_new = window
+            if start_ind == finish_ind:
+                U_curr, U_new = U_new, U_curr
+                window_curr, window_new = window_new, window_curr
+                time_steps.append(dt)
+                _t += dt
+                if write_snapshot is not None:
+                    write_snapshot(len(time_steps), _t, U_curr)
+                continue
+            if window != step_window:
+                stepper.reset_first_stage()
+                step_window = window
+                step_mesh = mesh.get_submesh(start_ind, finish_ind)
+            window_slice = (Ellipsis, slice(start_ind, finish_ind))
+
+        stepper.step(U_curr[window_slice], _t, step_mesh, dt, right_function_for_dUdt_problem,
+                     out=U_new[window_slice])
+        if adaptive:
+            stepper.error_estimate(dt, out=U_err[window_slice])
+            err_norm = get_error_norm(U_err[window_slice], U_curr[window_slice], U_new[window_slice],
+                                      rtol, atol, size=U_curr.size)
+            accepted = err_norm <= 1
+            dt_next = get_adaptive_dt(dt, err_norm, stepper.embedded_order, accepted)
+            if not accepted:
+                stepper.reject()
+                time_steps.n_rejected += 1
+                continue
+            stepper.accept()
+
+        U_curr, U_new = U_new, U_curr
+        if active_window:
+            window_curr, window_new = window_new, window_curr
         time_steps.append(dt)
         _t += dt
-    
-    return U_new, time_steps
+        if write_snapshot is not None:
+            write_snapshot(len(time_steps), _t, U_curr)
+        if profiler is not None:
+            profiler.step_done(len(time_steps), _t, U_curr)
+        if checkpoint_path is not None and time.perf_counter() - last_checkpoint >= checkpoint_interval:
+            write_checkpoint(iter_num + 1)
+            last_checkpoint = time.perf_counter()
+    else:
+        iter_num = N_iter_max
+
+    if checkpoint_path is not None:
+        write_checkpoint(iter_num)
+    time_steps.n_accepted = len(time_steps)
+    time_steps.n_rhs_calls = stepper.n_rhs_calls
+    if adaptive:
+        time_steps.dt_next = dt_next
+    if profiler is not None:
+        profiler.stop(time_steps)
+    return U_curr, time_steps
+
+
+def get_mesh_key(mesh):
+    """ Ключ сетки в виде, пригодном для JSON (см. Mesh.get_key) """
+    return [repr(value) for value in mesh.get_key()]
+
+
+def resume_runner(task_params, mesh, checkpoint_path, N_iter_max=None, total_time=None, show_progress=True,
+                  checkpoint_interval=600.0, snapshot_writer=None):
+    """ Продолжение расчёта с контрольной точки, записанной main_runner или ensemble_runner.
+
+        Расчёт продолжается с теми же методами и параметрами и даёт
+        тот же результат, что и расчёт без остановки. Функции задачи
+        в контрольной точке не хранятся, поэтому task_params и mesh
+        передаются заново. У методов со свойством FSAL первая стадия
+        после продолжения вычисляется заново, поэтому n_rhs_calls
+        больше на единицу.
+
+        Вход:
+            task_params: TaskParams
+                Параметры уравнения переноса (те же, что при первом запуске)
+            mesh: Mesh
+                Сетка (та же, что при первом запуске)
+            checkpoint_path: str
+                Файл контрольной точки; продолжение расчёта пишет контрольные точки в него же
+            N_iter_max: int
+                Новое максимальное число итераций (по умолчанию - сохранённое)
+            total_time: float
+                Новое конечное время (по умолчанию - сохранённое)
+            остальные аргументы - как в main_runner
+
+        Выход:
+            как в main_runner
+    """
+    state = Checkpoints.load_checkpoint(checkpoint_path)
+    params = state['params']
+    if params['mesh_key'] != get_mesh_key(mesh):
+        raise ValueError("Сетка не совпадает с сеткой контрольной точки")
+    N_iter_max = params['N_iter_max'] if N_iter_max is None else N_iter_max
+    total_time = params['total_time'] if total_time is None else total_time
+    return run_time_loop(task_params, state['U'], mesh, params['Cu'], total_time, params['time_step_method'],
+                         params['space_deriv_approx_method'], N_iter_max, rtol=params['rtol'], atol=params['atol'],
+                         show_progress=show_progress, boundary=params['boundary'],
+                         active_window=params['active_window'], window_tol=params['window_tol'],
+                         backend=params['backend'], snapshot_writer=snapshot_writer,
+                         checkpoint_path=checkpoint_path, checkpoint_interval=checkpoint_interval,
+                         upwind=params['upwind'], speed_cfl=params['speed_cfl'],
+                         precision=params['precision'], state=state)
 
 
 def get_error(U_numerical, U_analitical, mesh):
@@ -124,11 +768,12 @@ def get_error(U_numerical, U_analitical, mesh):
         Выход:
             norm : float
                 Вычисленная ошибка по L2-норме.
+                Для набора решений (n_members, N) - массив ошибок каждого члена.
     """
     difs = U_analitical - U_numerical
     difs2 = difs**2
-    difs2_dx = difs2 * mesh.dx
-    summ_difs2dx = np.sum(difs2_dx)
+    difs2_dx = difs2 * mesh.get_node_volumes()
+    summ_difs2dx = np.sum(difs2_dx, axis=-1)
     norm = np.sqrt(summ_difs2dx)
     return norm
 
@@ -150,3 +795,284 @@ def grid_conv_by_true(err1, err0):
     k = err1 / err0
     ord_conv = np.log2(k)
     return ord_conv
+
+
+def restrict_to_coarse(U_fine, n_levels=1):
+    """ Значения решения на узлах сетки, в 2**n_levels раз более грубой.
+
+        Сетки, полученные Mesh.get_twice_grid, вложены: каждый второй
+        узел подробной сетки совпадает с узлом грубой.
+
+        Вход:
+            U_fine : np.array
+                Решение на подробной сетке
+            n_levels : int
+                Число удвоений сетки между грубой и подробной сетками
+
+        Выход:
+            U_coarse : np.array
+                Решение в узлах грубой сетки
+    """
+    return U_fine[..., ::2**n_levels]
+
+
+def grid_conv_by_three(U_coarse, U_mid, U_fine, mesh_coarse):
+    """ Вычисление порядка сходимости по трём вложенным сеткам
+        без аналитического решения.
+
+        Все нормы считаются в узлах самой грубой сетки:
+            p = log2(||U_coarse - U_mid|| / ||U_mid - U_fine||)
+
+        Вход:
+            U_coarse, U_mid, U_fine : np.array
+                Численные решения на сетках mesh_coarse, mesh_coarse.get_twice_grid()
+                и ещё раз удвоенной сетке
+            mesh_coarse : Mesh
+                Самая грубая сетка
+
+        Выход:
+            ord_conv : float
+                Наблюдаемый порядок сходимости
+            err_fine : float
+                Оценка ошибки решения U_fine: ||U_mid - U_fine|| / (2**p - 1)
+    """
+    U_mid = restrict_to_coarse(U_mid, 1)
+    U_fine = restrict_to_coarse(U_fine, 2)
+    dif_coarse = get_error(U_coarse, U_mid, mesh_coarse)
+    dif_fine = get_error(U_mid, U_fine, mesh_coarse)
+    ord_conv = grid_conv_by_true(dif_coarse, dif_fine)
+    err_fine = dif_fine / (2**ord_conv - 1)
+    return ord_conv, err_fine
+
+
+def richardson_extrapolation(U_coarse, U_fine, ord_conv):
+    """ Экстраполяция по Ричардсону по двум соседним сеткам.
+
+        Вход:
+            U_coarse : np.array
+                Решение на грубой сетке
+            U_fine : np.array
+                Решение на сетке, полученной удвоением грубой
+            ord_conv : float
+                Порядок сходимости (например, из grid_conv_by_three)
+
+        Выход:
+            U_extrapolated : np.array
+                Уточнённое решение в узлах грубой сетки
+    """
+    U_fine = restrict_to_coarse(U_fine, 1)
+    return U_fine + (U_fine - U_coarse) / (2**ord_conv - 1)
+
+
+def grid_convergence_runner(task_params, mesh, Cu, total_time, time_step_method, space_deriv_approx_method,
+                            N_iter_max, max_levels=6, order_tol=0.05, err_tol=None, **runner_kw):
+    """ Исследование сходимости на последовательности вложенных сеток.
+
+        Сетка удваивается (Mesh.get_twice_grid), на каждой сетке задача
+        решается один раз, а решения предыдущих сеток используются повторно.
+        Начиная с третьей сетки, порядок сходимости и ошибка оцениваются
+        по трём последним сеткам (grid_conv_by_three). Удвоение прекращается,
+        когда порядок перестаёт меняться (изменение не больше order_tol)
+        или оценка ошибки становится не больше err_tol. Каждая лишняя сетка
+        стоит примерно в 4 раза дороже предыдущей, поэтому остановка
+        экономит большую часть времени расчёта.
+
+        Вход:
+            mesh : Mesh
+                Самая грубая сетка
+            max_levels : int
+                Максимальное число сеток
+            order_tol : float
+                Допуск на изменение наблюдаемого порядка между соседними тройками сеток
+            err_tol : float
+                Допуск на оценку ошибки решения на самой подробной сетке
+            runner_kw :
+                Дополнительные аргументы main_runner (rtol, boundary, backend и т.д.)
+            остальные аргументы - как в main_runner
+
+        Выход:
+            result : dict
+                'meshes' - список сеток от грубой к подробной,
+                'solutions' - решения на этих сетках,
+                'orders' - наблюдаемые порядки по тройкам сеток (начиная с третьей),
+                'errors' - оценки ошибки решения на подробной сетке каждой тройки,
+                'extrapolated' - экстраполированное по Ричардсону решение
+                на предпоследней сетке (None, если сеток меньше трёх),
+                'converged' - выполнен ли критерий остановки
+    """
+    runner_kw.setdefault('show_progress', False)
+    meshes = []
+    solutions = []
+    orders = []
+    errors = []
+    converged = False
+    for level in range(max_levels):
+        mesh = mesh if level == 0 else mesh.get_twice_grid()
+        U, _ = main_runner(task_params, mesh, Cu, total_time, time_step_method,
+                           space_deriv_approx_method, N_iter_max, **runner_kw)
+        meshes.append(mesh)
+        solutions.append(U)
+        if level < 2:
+            continue
+
+        ord_conv, err_fine = grid_conv_by_three(*solutions[-3:], meshes[-3])
+        orders.append(ord_conv)
+        errors.append(err_fine)
+        if err_tol is not None and np.all(err_fine <= err_tol):
+            converged = True
+        if len(orders) > 1 and np.all(np.abs(orders[-1] - orders[-2]) <= order_tol):
+            converged = True
+        if converged:
+            break
+
+    extrapolated = None
+    if orders:
+        extrapolated = richardson_extrapolation(solutions[-2], solutions[-1], orders[-1])
+    return dict(meshes=meshes, solutions=solutions, orders=orders, errors=errors,
+                extrapolated=extrapolated, converged=converged)
+
+
+def get_refined_cells(mesh_coarse, mesh, U, refine_tol, buffer_cells):
+    """ Ячейки грубой сетки, которые нужно измельчить.
+
+        Вход:
+            mesh_coarse : Mesh
+                Грубая равномерная сетка
+            mesh : Mesh
+                Сетка, на которой задано решение U
+            U : np.array
+                Текущее решение
+            refine_tol : float
+                Измельчаются ячейки, содержащие узлы с |U| > refine_tol
+            buffer_cells : int
+                Число ячеек, на которое область измельчения расширяется в обе стороны
+
+        Выход:
+            refined_cells : np.array[bool]
+                Массив длины mesh_coarse.N - 1
+    """
+    active = np.abs(U) > refine_tol
+    if U.ndim > 1:
+        active = active.any(axis=tuple(range(U.ndim - 1)))
+    cells = np.floor((mesh.xnodes[active] - mesh_coarse.xleft) / mesh_coarse.dx).astype(int)
+    refined_cells = np.zeros(mesh_coarse.N - 1)
+    refined_cells[np.clip(cells, 0, mesh_coarse.N - 2)] = 1
+    # расширение на buffer_cells ячеек в обе стороны
+    refined_cells = np.convolve(refined_cells, np.ones(2 * buffer_cells + 1), mode="same")
+    return refined_cells > 0
+
+
+def refined_runner(task_params, mesh, Cu, total_time, time_step_method, space_deriv_approx_method,
+                   N_iter_max, ratio=4, refine_tol=1e-8, buffer_cells=4, regrid_time=None, init_conds=None,
+                   **runner_kw):
+    """ Решение на блочно измельчённой сетке, которая следует за решением.
+
+        Ячейки грубой сетки mesh, где |U| > refine_tol, вместе с буфером
+        из buffer_cells ячеек делятся на ratio частей (NonuniformMesh.from_refined_cells).
+        Каждые regrid_time единиц времени область измельчения строится заново,
+        а решение переносится на новую сетку линейной интерполяцией. Узлы,
+        общие для старой и новой сеток, при этом не меняются, а новые
+        подробные узлы появляются только в буфере, где решение практически
+        равно нулю. Поэтому буфер должен быть шире пути, который решение
+        проходит за regrid_time.
+
+        Подходит для схем с диссипацией (например, "Upwind3", "Upwind5").
+        У центральных схем сеточные осцилляции бегут назад и доходят
+        до края области измельчения, где отражаются от скачка шага сетки.
+
+        Вход:
+            mesh : Mesh
+                Грубая равномерная сетка
+            ratio : int
+                Коэффициент измельчения
+            refine_tol : float
+                Порог, выше которого решение считается ненулевым
+            buffer_cells : int
+                Ширина буфера вокруг ненулевого решения, в ячейках грубой сетки
+            regrid_time : float
+                Интервал перестроения сетки. По умолчанию - время, за которое
+                решение с наибольшей начальной скоростью проходит половину буфера
+            init_conds : list[function]
+                Начальные условия набора решений (как в ensemble_runner);
+                сетка измельчается там, где ненулевое хотя бы одно из них.
+                По умолчанию - одно решение с task_params.init_cond
+            runner_kw :
+                Дополнительные аргументы run_time_loop (rtol, boundary и т.д.)
+            остальные аргументы - как в main_runner
+
+        Выход:
+            mesh : NonuniformMesh
+                Сетка в конечный момент времени
+            U : np.array
+                Численное решение на этой сетке: (N,) или (len(init_conds), N)
+            time_steps : TimeStepsHistory
+                Как в main_runner
+    """
+    runner_kw.setdefault('show_progress', False)
+
+    def get_init_fields(mesh):
+        if init_conds is None:
+            return get_init_field(mesh, task_params.init_cond)
+        return np.stack([get_init_field(mesh, init_cond) for init_cond in init_conds])
+
+    U = get_init_fields(mesh)
+    refined_cells = get_refined_cells(mesh, mesh, U, refine_tol, buffer_cells)
+    fine_mesh = models.NonuniformMesh.from_refined_cells(mesh.xleft, mesh.xright, mesh.N, refined_cells, ratio)
+    U = get_init_fields(fine_mesh)
+    if regrid_time is None:
+        speed = np.max(np.abs(task_params.speed_function(fine_mesh, U)))
+        regrid_time = 0.5 * buffer_cells * mesh.dx / speed
+
+    _t = 0
+    time_steps = TimeStepsHistory()
+    while _t < total_time:
+        n_steps = len(time_steps)
+        state = dict(t=_t, time_steps=list(time_steps), n_rejected=time_steps.n_rejected,
+                     n_rhs_calls=time_steps.n_rhs_calls, iter_num=n_steps + time_steps.n_rejected,
+                     dt_next=fine_mesh.dx * Cu if time_steps.dt_next is None else time_steps.dt_next)
+        U, time_steps = run_time_loop(task_params, U, fine_mesh, Cu, min(_t + regrid_time, total_time),
+                                      time_step_method, space_deriv_approx_method, N_iter_max,
+                                      state=state, **runner_kw)
+        # время накапливается так же, как в run_time_loop
+        for dt in time_steps[n_steps:]:
+            _t += dt
+        if len(time_steps) + time_steps.n_rejected >= N_iter_max:
+            break
+
+        new_refined_cells = get_refined_cells(mesh, fine_mesh, U, refine_tol, buffer_cells)
+        if np.array_equal(new_refined_cells, refined_cells):
+            continue
+        refined_cells = new_refined_cells
+        new_mesh = models.NonuniformMesh.from_refined_cells(mesh.xleft, mesh.xright, mesh.N, refined_cells, ratio)
+        # интерполяция по последней оси для каждого решения набора
+        U = np.stack([np.interp(new_mesh.xnodes, fine_mesh.xnodes, U_member)
+                      for U_member in U.reshape(-1, U.shape[-1])]).reshape(U.shape[:-1] + (new_mesh.N,))
+        fine_mesh = new_mesh
+    return fine_mesh, U, time_steps
+
+
+def _numba_threads_started():
+    """ Запущен ли в текущем процессе пул потоков параллельных ядер numba """
+    parallel = sys.modules.get("numba.np.ufunc.parallel")
+    # если признак недоступен, безопаснее считать, что пул запущен
+    return parallel is not None and getattr(parallel, "_is_initialized", True)
+
+
+def get_mp_context():
+    """ Способ запуска процессов-работников (sweeps, DomainDecomposition).
+
+        fork позволяет работникам найти функции задачи, определённые
+        в ноутбуке (в __main__). Но после расчёта с backend="numba" в процессе
+        работает пул потоков numba, и fork приводит к зависанию, поэтому тогда
+        используется forkserver (или spawn): аргументы работников передаются
+        через pickle, и функции задачи должны импортироваться из модуля.
+
+        Выход:
+            context: multiprocessing.context.BaseContext
+    """
+    start_methods = multiprocessing.get_all_start_methods()
+    if "fork" in start_methods and not _numba_threads_started():
+        return multiprocessing.get_context("fork")
+    if "forkserver" in start_methods:
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")